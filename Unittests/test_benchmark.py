@@ -0,0 +1,127 @@
+import asyncio
+import gc
+import json
+import logging
+import os
+import re
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+from unittest import TestCase, skipUnless
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCHMARK")
+
+import catalog
+import keyboard
+import text
+import webparser
+
+logger = logging.getLogger(__name__)
+FIXTURES = Path(__file__).parent / "fixtures"
+BENCH = os.getenv("BENCH") == "1"
+BASELINE = Path(os.getenv("BENCH_BASELINE", FIXTURES / "bench_baseline.json"))
+REGRESSION = float(os.getenv("BENCH_REGRESSION", 3.0))
+SLACK_MS = 0.01
+UPDATE_BASELINE = os.getenv("BENCH_UPDATE_BASELINE") == "1"
+SIZES = (5, 100, 300)
+
+
+def scale_fixture(html: str, size: int) -> str:
+    machines = re.findall(r'( *<div class="col mb-3 childItem child\d+">.*?\n {8}</div>\n)', html, re.S)
+    blocks = []
+    for num in range(1, size + 1):
+        block = machines[(num - 1) % len(machines)]
+        block = re.sub(r"childItem child\d+", f"childItem child{num}", block)
+        block = re.sub(r'(<div class="text-center h3">)\d+', rf"\g<1>{num}", block)
+        blocks.append(block)
+    start = html.index(machines[0])
+    end = html.index(machines[-1]) + len(machines[-1])
+    return html[:start] + "".join(blocks) + html[end:]
+
+
+def measure(func: Callable[[], object], min_time: float = 0.05) -> tuple[float, int]:
+    func()
+    runs = 0
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        while time.perf_counter() - start < min_time:
+            func()
+            runs += 1
+        per_op = (time.perf_counter() - start) / runs
+    finally:
+        gc.enable()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_op, peak
+
+
+@skipUnless(BENCH or UPDATE_BASELINE, "BENCH is not set")
+class TestBenchmark(TestCase):
+    results: dict[str: float] = {}
+
+    @classmethod
+    def setUpClass(cls):
+        with open(FIXTURES / "laundry.html", encoding="utf8") as file:
+            html = file.read()
+        cls.pages = {size: scale_fixture(html, size) for size in SIZES}
+        cls.baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+        cls.results = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if UPDATE_BASELINE:
+            BASELINE.write_text(json.dumps(cls.results, indent=4, sort_keys=True) + "\n")
+
+    def check(self, name: str, func: Callable[[], object]) -> None:
+        per_op, peak = measure(func)
+        self.results[name] = round(per_op * 1000, 4)
+        logger.info(f"{name:<32} {per_op * 1000:10.3f} ms/op {1 / per_op:12.1f} op/s {peak / 1024:10.1f} KiB peak")
+        if not UPDATE_BASELINE and name in self.baseline:
+            limit = self.baseline[name] * (1 + REGRESSION) + SLACK_MS
+            self.assertLessEqual(per_op * 1000, limit,
+                                 f"{name}: {per_op * 1000:.3f} ms/op exceeds {limit:.3f} ms/op "
+                                 f"(baseline {self.baseline[name]:.3f} ms/op)")
+
+    def test_scaled_fixture(self):
+        for size in SIZES:
+            self.assertEqual(len(webparser.parse_snapshot(self.pages[size]).machines), size)
+
+    def test_parse(self):
+        for backend in ("bs4", "lxml"):
+            for size in SIZES:
+                page = self.pages[size]
+                self.check(f"parse_{backend}_{size}", lambda: webparser.parse_snapshot(page, backend))
+
+    def test_render_status(self):
+        for size in SIZES:
+            snapshot = webparser.parse_snapshot(self.pages[size])
+            self.check(f"render_status_cold_{size}", lambda: text.StatusRenderer().render(snapshot))
+            self.check(f"render_status_{size}", lambda: text.render_status(snapshot))
+
+    def test_menu_sub(self):
+        loop = asyncio.new_event_loop()
+        try:
+            for size in SIZES:
+                machines = webparser.parse_snapshot(self.pages[size]).machines
+                subs = [(machine.site, machine.seq_num) for machine in machines[::3]]
+                self.check(f"menu_sub_{size}",
+                           lambda: loop.run_until_complete(keyboard.menu_sub(machines, subs)))
+        finally:
+            loop.close()
+
+    def test_menu_sub_toggle(self):
+        for size in SIZES:
+            kb = keyboard.SubKeyboard(catalog.Catalog(webparser.parse_snapshot(self.pages[size]).machines))
+            machine = kb.catalog.machines[-1]
+
+            def toggle():
+                keyboard._markups.clear()
+                kb.markup(0)
+                kb.toggle(0, machine.site, machine.seq_num)
+
+            self.check(f"menu_sub_toggle_{size}", toggle)
@@ -0,0 +1,73 @@
+import os
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import AsyncMock, patch
+
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+
+import catalog
+from database import Machine
+from webparser import MachineInfo
+
+MACHINES = (
+    MachineInfo(seq_num=1, type="Стиральная машина", prise=100, site="a"),
+    MachineInfo(seq_num=2, type="Сушильная машина", prise=80, site="a"),
+    MachineInfo(seq_num=1, type="Стиральная машина", prise=120, site="b"),
+)
+
+
+class TestCatalog(TestCase):
+
+    def setUp(self):
+        self.catalog = catalog.Catalog(MACHINES)
+
+    def test_mask_round_trip(self):
+        subs = [("a", 2), ("b", 1)]
+        mask = self.catalog.to_mask(subs)
+        self.assertEqual(mask, 0b110)
+        self.assertEqual(self.catalog.to_subs(mask), subs)
+        self.assertEqual(self.catalog.to_subs(~mask), [("a", 1)])
+
+    def test_unknown_subs_are_ignored(self):
+        self.assertEqual(self.catalog.to_mask([("c", 1)]), 0)
+
+    def test_toggle(self):
+        mask = self.catalog.toggle(0, "a", 1)
+        self.assertEqual(self.catalog.to_subs(mask), [("a", 1)])
+        self.assertEqual(self.catalog.toggle(mask, "a", 1), 0)
+        with self.assertRaises(KeyError):
+            self.catalog.toggle(mask, "a", 3)
+
+    def test_version_depends_on_content(self):
+        self.assertEqual(catalog.Catalog(MACHINES).version, self.catalog.version)
+        self.assertNotEqual(catalog.Catalog(MACHINES[:2]).version, self.catalog.version)
+
+
+class TestCatalogCache(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        catalog.invalidate()
+        catalog._versions.clear()
+        self.rows = [Machine(seq_num=machine.seq_num, type=machine.type, prise=machine.prise, site=machine.site)
+                     for machine in MACHINES]
+        patcher = patch("database.get_machines", AsyncMock(side_effect=lambda bot_id: self.rows))
+        self.get_machines = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_catalog_is_cached(self):
+        first = await catalog.get_catalog(42)
+        second = await catalog.get_catalog(42)
+        self.assertIs(first, second)
+        self.assertEqual(first.machines, MACHINES)
+        self.assertEqual(self.get_machines.await_count, 1)
+
+    async def test_old_version_survives_refresh(self):
+        old = await catalog.get_catalog(42)
+        self.rows = self.rows[:2]
+        catalog.invalidate()
+        new = await catalog.get_catalog(42)
+        self.assertNotEqual(old.version, new.version)
+        self.assertIs(await catalog.get_catalog_version(42, old.version), old)
+
+    async def test_unknown_version(self):
+        await catalog.get_catalog(42)
+        self.assertIsNone(await catalog.get_catalog_version(42, "0" * 16))
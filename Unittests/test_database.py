@@ -0,0 +1,145 @@
+import os
+from unittest import IsolatedAsyncioTestCase, skipUnless
+from unittest.mock import AsyncMock, Mock, patch
+
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+
+from sqlalchemy import select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import database
+import migrations
+from database import Sub, User, UserProfile
+
+TEST_DB_URL = os.getenv("TEST_DB_URL")
+SCHEMA = "washbot_database_test"
+
+
+@skipUnless(TEST_DB_URL, "TEST_DB_URL is not set")
+class TestApplySubDiff(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.admin = create_async_engine(TEST_DB_URL)
+        async with self.admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        self.engine = create_async_engine(TEST_DB_URL, connect_args={"server_settings": {"search_path": SCHEMA}})
+        await migrations.migrate(self.engine)
+        async with self.engine.begin() as conn:
+            await conn.execute(text('INSERT INTO "Bot" (id, username) VALUES (1, \'bot\')'))
+            await conn.execute(text(
+                'INSERT INTO "Machine" (seq_num, bot_id, site, type, prise) '
+                "SELECT n, 1, 'main', 'washer', 100 FROM generate_series(1, 4) AS n"
+            ))
+            await conn.execute(text('INSERT INTO "User" (id, bot_id, username, lang) VALUES (10, 1, \'user\', \'ru\')'))
+        patcher = patch.multiple(database,
+                                 _engine=self.engine,
+                                 _async_session=async_sessionmaker(self.engine, expire_on_commit=False))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        async with self.admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await self.admin.dispose()
+
+    async def rows(self) -> set[tuple[int, str, int]]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(select(Sub.user_id, Sub.site, Sub.seq_num))
+            return set(result.all())
+
+    async def test_apply_sub_diff(self):
+        subs = await database.apply_sub_diff(10, 1, [("main", 1), ("main", 2)], [])
+        self.assertEqual(subs, (("main", 1), ("main", 2)))
+        subs = await database.apply_sub_diff(10, 1, [("main", 2), ("main", 3)], [("main", 1), ("main", 4)])
+        self.assertEqual(subs, (("main", 2), ("main", 3)))
+        self.assertEqual(await self.rows(), {(10, "main", 2), (10, "main", 3)})
+        self.assertEqual(await database.apply_sub_diff(10, 1, [], []), (("main", 2), ("main", 3)))
+
+    async def test_unknown_machine_rolls_back(self):
+        await database.apply_sub_diff(10, 1, [("main", 1)], [])
+        with self.assertRaises(IntegrityError):
+            await database.apply_sub_diff(10, 1, [("main", 2), ("main", 99)], [("main", 1)])
+        self.assertEqual(await self.rows(), {(10, "main", 1)})
+
+
+class FakeSession:
+
+    def __init__(self, objects=()):
+        self.objects = {obj.id: obj for obj in objects}
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def add_all(self, objects):
+        self.objects.update((obj.id, obj) for obj in objects)
+
+    async def get(self, obj_type, obj_id):
+        return self.objects.get(obj_id)
+
+    async def delete(self, obj):
+        self.objects.pop(obj.id)
+
+    async def execute(self, stmt):
+        return Mock(rowcount=1)
+
+    async def commit(self):
+        pass
+
+
+class TestProfileCache(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.select = AsyncMock(return_value=UserProfile(lang="ru", bot_id=1))
+        self.session = FakeSession([User(id=10, bot_id=1, username="user", lang="ru")])
+        for patcher in (patch.object(database, "_select_user_profile", self.select),
+                        patch.object(database, "_async_session", self.session),
+                        patch.object(database, "profiles", database.LRUCache(maxsize=16, ttl=60))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_repeat_lookup_is_cached(self):
+        self.assertEqual(await database.get_user_profile(10), UserProfile(lang="ru", bot_id=1))
+        self.assertEqual(await database.get_user_lang(10), "ru")
+        self.assertEqual(self.select.await_count, 1)
+
+    async def test_unknown_user_is_cached(self):
+        self.select.return_value = None
+        self.assertIsNone(await database.get_user_profile(20))
+        self.assertIsNone(await database.get_user_lang(20))
+        self.assertEqual(self.select.await_count, 1)
+
+    async def test_add_user_fills_cache(self):
+        self.select.return_value = None
+        self.assertIsNone(await database.get_user_profile(20))
+        await database.add_object(User(id=20, bot_id=2, username="new", lang="en"))
+        self.assertEqual(await database.get_user_profile(20), UserProfile(lang="en", bot_id=2))
+        self.assertEqual(self.select.await_count, 1)
+
+    async def test_updates_are_written_through(self):
+        await database.get_user_profile(10)
+        await database.set_user_lang(10, "en")
+        await database.update_bot_id(10, 2)
+        self.assertEqual(await database.get_user_profile(10), UserProfile(lang="en", bot_id=2))
+        self.assertEqual(self.select.await_count, 1)
+
+    async def test_update_of_uncached_user_is_ignored(self):
+        await database.set_user_lang(10, "en")
+        self.assertNotIn(10, database.profiles)
+        await database.get_user_profile(10)
+        self.assertEqual(self.select.await_count, 1)
+
+    async def test_remove_user_evicts(self):
+        await database.get_user_profile(10)
+        await database.remove_by_id(obj_type=User, obj_id=10)
+        self.select.return_value = None
+        self.assertIsNone(await database.get_user_profile(10))
+        self.assertEqual(self.select.await_count, 2)
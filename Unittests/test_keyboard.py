@@ -0,0 +1,57 @@
+import asyncio
+import os
+from unittest import TestCase
+
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+
+import keyboard
+from catalog import Catalog
+from webparser import MachineInfo
+
+MACHINES = tuple(MachineInfo(seq_num=num, type="Стиральная машина", prise=100) for num in range(1, 6))
+
+
+class TestSubKeyboard(TestCase):
+
+    def setUp(self):
+        keyboard._markups.clear()
+        keyboard._keyboards.clear()
+        self.catalog = Catalog(MACHINES)
+        self.kb = keyboard.sub_keyboard(self.catalog)
+
+    def test_keyboard_is_shared_per_version(self):
+        self.assertIs(keyboard.sub_keyboard(Catalog(MACHINES)), self.kb)
+
+    def test_markup(self):
+        menu = self.kb.markup(0b101)
+        rows = menu["ru"].inline_keyboard
+        self.assertEqual(len(rows), len(MACHINES) + 3)
+        self.assertTrue(rows[0][0].text.startswith("➤"))
+        self.assertFalse(rows[1][0].text.startswith("➤"))
+        self.assertEqual(rows[2][0].callback_data, f"m{MACHINES[2].site}:3")
+        self.assertEqual(menu["en"].inline_keyboard[-1][0].callback_data, "delete")
+        self.assertIs(self.kb.markup(0b101), menu)
+
+    def test_toggle_swaps_one_row(self):
+        old = self.kb.markup(0b101)
+        mask, menu = self.kb.toggle(0b101, MACHINES[1].site, 2)
+        self.assertEqual(mask, 0b111)
+        for lang in menu:
+            rows, old_rows = menu[lang].inline_keyboard, old[lang].inline_keyboard
+            self.assertEqual(menu[lang], self.kb.build(mask)[lang])
+            self.assertIsNot(rows[1], old_rows[1])
+            self.assertTrue(all(rows[pos] is old_rows[pos] for pos in range(len(rows)) if pos != 1))
+        self.assertIs(self.kb.markup(mask), menu)
+
+    def test_toggle_without_cached_markup(self):
+        mask, menu = self.kb.toggle(0, MACHINES[0].site, 1)
+        self.assertEqual(menu, self.kb.build(0b1))
+
+    def test_unknown_machine(self):
+        with self.assertRaises(KeyError):
+            self.kb.toggle(0, MACHINES[0].site, 42)
+
+    def test_menu_sub_matches_builder(self):
+        subs = [(MACHINES[0].site, 1), (MACHINES[4].site, 5)]
+        menu = asyncio.run(keyboard.menu_sub(MACHINES, subs))
+        self.assertEqual(menu, self.kb.build(0b10001))
@@ -0,0 +1,98 @@
+import asyncio
+import tempfile
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+import leader
+
+
+class TestLeaderElection(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.tmp.name) / "leader.lock")
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    async def test_file_lock(self):
+        first, second = leader.FileLock(self.path), leader.FileLock(self.path)
+        self.assertTrue(await first.acquire())
+        self.assertFalse(await second.acquire())
+        await first.release()
+        self.assertTrue(await second.acquire())
+        await second.release()
+
+    async def test_failover(self):
+        polling = []
+
+        def replica(name: str):
+            async def job():
+                polling.append(name)
+                await asyncio.Event().wait()
+            return asyncio.create_task(leader.run_as_leader(
+                lock=leader.FileLock(self.path),
+                jobs=[job],
+                retry_interval=0.01,
+                check_interval=0.01
+            ))
+
+        first = replica("first")
+        await asyncio.sleep(0.05)
+        second = replica("second")
+        await asyncio.sleep(0.05)
+        self.assertEqual(polling, ["first"])
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        self.assertEqual(polling, ["first", "second"])
+        second.cancel()
+        await asyncio.gather(second, return_exceptions=True)
+
+    async def test_flaky_lock(self):
+        polling = []
+
+        class FlakyLock(leader.FileLock):
+            calls = {"acquire": 0, "check": 0, "release": 0}
+
+            async def acquire(self):
+                self.calls["acquire"] += 1
+                if self.calls["acquire"] == 1:
+                    raise RuntimeError("acquire")
+                return await super().acquire()
+
+            async def check(self):
+                self.calls["check"] += 1
+                if self.calls["check"] == 2:
+                    raise RuntimeError("check")
+                return await super().check()
+
+            async def release(self):
+                self.calls["release"] += 1
+                await super().release()
+                if self.calls["release"] == 1:
+                    raise RuntimeError("release")
+
+        async def job():
+            polling.append(len(polling))
+            await asyncio.Event().wait()
+
+        task = asyncio.create_task(leader.run_as_leader(
+            lock=FlakyLock(self.path),
+            jobs=[job],
+            retry_interval=0.01,
+            check_interval=0.01
+        ))
+        await asyncio.sleep(0.1)
+        self.assertFalse(task.done())
+        self.assertEqual(polling, [0, 1])
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def test_leader_election_needs_shared_cache(self):
+        with patch.multiple(leader.config, LEADER_ELECTION="file", CACHE_SHARED=False):
+            with self.assertRaises(ValueError):
+                leader.create_lock()
+        with patch.multiple(leader.config, LEADER_ELECTION="file", CACHE_SHARED=True, LEADER_LOCK_PATH=self.path):
+            self.assertIsInstance(leader.create_lock(), leader.FileLock)
@@ -0,0 +1,34 @@
+import time
+from unittest import TestCase
+
+from lru import LRUCache
+
+
+class TestLRUCache(TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.set(1, "a")
+        cache.set(2, "b")
+        cache.get(1)
+        cache.set(3, "c")
+        self.assertEqual(len(cache), 2)
+        self.assertIn(1, cache)
+        self.assertNotIn(2, cache)
+
+    def test_ttl(self):
+        cache = LRUCache(maxsize=2, ttl=0.01)
+        cache.set(1, "a")
+        self.assertEqual(cache.get(1), "a")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(len(cache), 0)
+
+    def test_cached_none(self):
+        cache = LRUCache(maxsize=2)
+        cache.set(1, None)
+        self.assertIn(1, cache)
+        self.assertEqual(cache.get(1, "missing"), None)
+        cache.pop(1)
+        self.assertEqual(cache.get(1, "missing"), "missing")
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
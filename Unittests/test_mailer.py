@@ -0,0 +1,81 @@
+import time
+from unittest import IsolatedAsyncioTestCase
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+from cashews import Cache
+
+import mailer
+
+
+class FakeBot:
+
+    def __init__(self, blocked=(), flood=()):
+        self.blocked = set(blocked)
+        self.flood = set(flood)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup):
+        method = SendMessage(chat_id=chat_id, text=text)
+        if chat_id in self.blocked:
+            raise TelegramForbiddenError(method=method, message="Forbidden: bot was blocked by the user")
+        if chat_id in self.flood:
+            self.flood.discard(chat_id)
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0)
+        self.sent.append((chat_id, text, reply_markup))
+
+
+class TestMailer(IsolatedAsyncioTestCase):
+
+    async def test_broadcast(self):
+        bot = FakeBot(blocked=[3], flood=[2])
+        result = await mailer.broadcast(
+            bot=bot,
+            users_id=[1, 2, 3, 4],
+            langs={1: "ru", 2: "en", 3: "en"},
+            message={"ru": "привет", "en": "hello"},
+            reply_markup={"ru": "ru", "en": "en"}
+        )
+        self.assertEqual(result.delivered, 3)
+        self.assertEqual(result.blocked, 1)
+        self.assertEqual(result.failed, 0)
+        self.assertEqual(result.retry_after, 1)
+        self.assertEqual(result.blocked_users, [3])
+        self.assertEqual(sorted(bot.sent), [(1, "привет", "ru"), (2, "hello", "en"), (4, "привет", "ru")])
+
+    async def test_token_bucket(self):
+        bucket = mailer.TokenBucket(rate=100, capacity=1)
+        start = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    async def test_chat_limiter(self):
+        limiter = mailer.ChatLimiter(interval=0.05)
+        start = time.monotonic()
+        await limiter.wait(1)
+        await limiter.wait(2)
+        self.assertLess(time.monotonic() - start, 0.04)
+        await limiter.wait(1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    async def test_shared_rate_limiter(self):
+        cache = Cache()
+        cache.setup("mem://")
+        first = mailer.SharedRateLimiter(cache, rate=3, key="test:rate")
+        second = mailer.SharedRateLimiter(cache, rate=3, key="test:rate")
+        windows = []
+        for limiter in (first, second) * 4:
+            await limiter.acquire()
+            windows.append(int(time.time()))
+        self.assertLessEqual(max(windows.count(window) for window in windows), 3)
+
+    async def test_shared_pause(self):
+        cache = Cache()
+        cache.setup("mem://")
+        first = mailer.SharedRateLimiter(cache, rate=100, key="test:pause")
+        second = mailer.SharedRateLimiter(cache, rate=100, key="test:pause")
+        await first.pause(0.1)
+        start = time.monotonic()
+        await second.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.08)
@@ -0,0 +1,74 @@
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import metrics
+from lru import LRUCache
+
+
+class TestRegistry(TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter(self):
+        counter = self.registry.counter("test_total", "Test counter", ["site"])
+        counter.inc(site="a")
+        counter.inc(2, site="a")
+        counter.inc(site='b"\n')
+        self.assertEqual(counter.get(site="a"), 3)
+        text = self.registry.render()
+        self.assertIn("# TYPE test_total counter\n", text)
+        self.assertIn('test_total{site="a"} 3\n', text)
+        self.assertIn('test_total{site="b\\"\\n"} 1\n', text)
+
+    def test_gauge_with_function(self):
+        value = 4
+        self.registry.gauge("test_pending", "Test gauge", func=lambda: value)
+        self.assertIn("test_pending 4\n", self.registry.render())
+
+    def test_histogram(self):
+        histogram = self.registry.histogram("test_seconds", "Test histogram", buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        text = self.registry.render()
+        self.assertIn('test_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('test_seconds_bucket{le="1"} 2\n', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3\n', text)
+        self.assertIn("test_seconds_sum 5.55\n", text)
+        self.assertIn("test_seconds_count 3\n", text)
+        with histogram.time():
+            pass
+        self.assertEqual(histogram.count(), 4)
+
+    def test_duplicate_name(self):
+        self.registry.counter("test_total", "Test counter")
+        with self.assertRaises(ValueError):
+            self.registry.gauge("test_total", "Test gauge")
+
+    def test_cache_ratio(self):
+        cache = LRUCache(maxsize=2)
+        self.registry.track_cache("lru", cache)
+        cache.set(1, 1)
+        cache.get(1)
+        cache.get(1)
+        cache.get(2)
+        self.assertEqual(self.registry.cache_stats("hits"), {("lru",): 2})
+        self.assertAlmostEqual(self.registry.cache_ratios()[("lru",)], 2 / 3)
+
+
+class TestMetricsServer(IsolatedAsyncioTestCase):
+
+    async def test_metrics_endpoint(self):
+        metrics.registry.track_cache("test", LRUCache(maxsize=1))
+        self.addCleanup(metrics.registry._caches.pop, "test")
+        client = TestClient(TestServer(metrics.create_app()))
+        await client.start_server()
+        try:
+            response = await client.get("/metrics")
+            self.assertEqual(response.status, 200)
+            self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+            self.assertIn('washbot_cache_hits_total{cache="test"} 0', await response.text())
+        finally:
+            await client.close()
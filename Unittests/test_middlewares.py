@@ -0,0 +1,48 @@
+import json
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message, Update
+
+import middlewares
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+class TestLatencyMiddleware(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        router = Router()
+        router.message.middleware(middlewares.HandlerLatencyMiddleware())
+
+        @router.message()
+        async def on_test_message(message: Message):
+            pass
+
+        self.dp = Dispatcher()
+        self.dp.update.outer_middleware(middlewares.UpdateLatencyMiddleware(threshold=0))
+        self.dp.include_router(router)
+        self.bot = Bot("42:TEST")
+        self.update = json.loads((FIXTURES / "update_message.json").read_text())
+
+    async def asyncTearDown(self):
+        await self.bot.session.close()
+
+    async def test_latency_is_recorded(self):
+        handled = middlewares.handler_seconds.count(handler="on_test_message")
+        updates = middlewares.update_seconds.count(type="message", handler="on_test_message")
+        slow = middlewares.slow_updates.get(type="message")
+        with self.assertLogs("middlewares", level="WARNING") as logs:
+            await self.dp.feed_update(self.bot, Update.model_validate(self.update, context={"bot": self.bot}))
+        self.assertEqual(middlewares.handler_seconds.count(handler="on_test_message"), handled + 1)
+        self.assertEqual(middlewares.update_seconds.count(type="message", handler="on_test_message"), updates + 1)
+        self.assertEqual(middlewares.slow_updates.get(type="message"), slow + 1)
+        self.assertIn("handled by on_test_message", logs.output[0])
+
+    async def test_unhandled_update(self):
+        update = dict(self.update, message=None, edited_message=self.update["message"])
+        before = middlewares.update_seconds.count(type="edited_message", handler="unhandled")
+        with self.assertLogs("middlewares", level="WARNING"):
+            await self.dp.feed_update(self.bot, Update.model_validate(update, context={"bot": self.bot}))
+        self.assertEqual(middlewares.update_seconds.count(type="edited_message", handler="unhandled"), before + 1)
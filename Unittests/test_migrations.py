@@ -0,0 +1,81 @@
+import os
+from unittest import IsolatedAsyncioTestCase, skipUnless
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import migrations
+from database import SchemaVersion, Sub, User
+
+TEST_DB_URL = os.getenv("TEST_DB_URL")
+SCHEMA = "washbot_test"
+
+
+@skipUnless(TEST_DB_URL, "TEST_DB_URL is not set")
+class TestMigrations(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.admin = create_async_engine(TEST_DB_URL)
+        async with self.admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        self.engine = create_async_engine(TEST_DB_URL, connect_args={"server_settings": {"search_path": SCHEMA}})
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        async with self.admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await self.admin.dispose()
+
+    async def explain(self, stmt) -> str:
+        sql = stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+        async with self.engine.connect() as conn:
+            return "\n".join(await conn.scalars(text(f"EXPLAIN {sql}")))
+
+    async def test_migrations_are_applied_once(self):
+        self.assertEqual(await migrations.migrate(self.engine), len(migrations.MIGRATIONS))
+        self.assertEqual(await migrations.migrate(self.engine), 0)
+        async with self.engine.connect() as conn:
+            versions = list(await conn.scalars(select(SchemaVersion.version).order_by(SchemaVersion.version)))
+        self.assertEqual(versions, [migration.version for migration in migrations.MIGRATIONS])
+
+    async def test_redundant_user_indexes_are_dropped(self):
+        await migrations.migrate(self.engine)
+        async with self.engine.begin() as conn:
+            await conn.execute(text('CREATE INDEX "ix_User_profile" ON "User" (id) INCLUDE (lang, bot_id)'))
+            await conn.execute(text('CREATE INDEX "ix_User_bot_id" ON "User" (bot_id)'))
+            await conn.execute(text('DELETE FROM "SchemaVersion" WHERE version IN (5, 6)'))
+        self.assertEqual(await migrations.migrate(self.engine), 2)
+        async with self.engine.connect() as conn:
+            indexes = list(await conn.scalars(text(
+                "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = 'User'"
+            )))
+        self.assertEqual(indexes, ["User_pkey"])
+
+    async def test_hot_queries_use_indexes(self):
+        await migrations.migrate(self.engine)
+        async with self.engine.begin() as conn:
+            await conn.execute(text('INSERT INTO "Bot" (id, username) VALUES (1, \'bot\')'))
+            await conn.execute(text(
+                'INSERT INTO "Machine" (seq_num, bot_id, site, type, prise) '
+                "SELECT n, 1, 'main', 'washer', 100 FROM generate_series(1, 50) AS n"
+            ))
+            await conn.execute(text(
+                'INSERT INTO "User" (id, bot_id, username, lang) '
+                "SELECT n, 1, 'user' || n, 'ru' FROM generate_series(1, 20000) AS n"
+            ))
+            await conn.execute(text(
+                'INSERT INTO "Sub" (user_id, seq_num, bot_id, site) '
+                "SELECT n, n % 50 + 1, 1, 'main' FROM generate_series(1, 20000) AS n"
+            ))
+            await conn.execute(text('ANALYZE "User"'))
+            await conn.execute(text('ANALYZE "Sub"'))
+        plan = await self.explain(select(Sub.user_id)
+                                  .where(Sub.seq_num == 7)
+                                  .where(Sub.bot_id == 1)
+                                  .where(Sub.site == "main")
+                                  .order_by(Sub.user_id))
+        self.assertIn("ix_Sub_fanout", plan)
+        plan = await self.explain(select(User.id, User.lang).where(User.id.in_([1, 2, 3])))
+        self.assertNotIn("Seq Scan", plan)
@@ -0,0 +1,207 @@
+import asyncio
+import os
+from unittest import IsolatedAsyncioTestCase, skipUnless
+from unittest.mock import AsyncMock, Mock, patch
+
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import database
+import mailer
+import migrations
+import outbox
+from database import Notification, NotificationJob
+
+TEST_DB_URL = os.getenv("TEST_DB_URL")
+SCHEMA = "washbot_outbox_test"
+MESSAGE = {"ru": "Статус", "en": "Status"}
+
+
+@skipUnless(TEST_DB_URL, "TEST_DB_URL is not set")
+class TestOutbox(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.admin = create_async_engine(TEST_DB_URL)
+        async with self.admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        self.engine = create_async_engine(TEST_DB_URL, connect_args={"server_settings": {"search_path": SCHEMA}})
+        await migrations.migrate(self.engine)
+        patcher = patch.multiple(database,
+                                 _engine=self.engine,
+                                 _async_session=async_sessionmaker(self.engine, expire_on_commit=False))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        outbox._messages.clear()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        async with self.admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await self.admin.dispose()
+
+    async def states(self) -> dict[tuple[int, str]: str]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(select(Notification.user_id, Notification.version, Notification.state))
+            return {(user_id, version): state for user_id, version, state in result.all()}
+
+    async def test_enqueue_deduplicates_and_supersedes(self):
+        self.assertEqual(await outbox.enqueue("main", "v1", MESSAGE, [1, 2]), 2)
+        self.assertEqual(await outbox.enqueue("main", "v1", MESSAGE, [1, 2, 3]), 1)
+        self.assertEqual(await outbox.enqueue("main", "v2", MESSAGE, [1]), 1)
+        self.assertEqual(await self.states(), {
+            (1, "v1"): "superseded", (2, "v1"): "pending", (3, "v1"): "pending", (1, "v2"): "pending"
+        })
+
+    async def test_concurrent_claims_are_disjoint(self):
+        await outbox.enqueue("main", "v1", MESSAGE, list(range(1, 101)))
+        batches = await asyncio.gather(*(database.claim_notifications(42, 30, 60, 5) for _ in range(4)))
+        jobs = [job.id for batch in batches for job in batch]
+        self.assertEqual(len(jobs), 100)
+        self.assertEqual(len(set(jobs)), 100)
+        self.assertEqual(await database.claim_notifications(42, 30, 60, 5), [])
+
+    async def test_expired_lease_is_claimed_again(self):
+        await outbox.enqueue("main", "v1", MESSAGE, [1])
+        self.assertEqual(len(await database.claim_notifications(42, 10, 0, 2)), 1)
+        self.assertEqual(len(await database.claim_notifications(42, 10, 0, 2)), 1)
+        self.assertEqual(await database.claim_notifications(42, 10, 0, 2), [])
+
+    async def test_exhausted_jobs_are_dead(self):
+        await outbox.enqueue("main", "v1", MESSAGE, [1])
+        self.assertEqual(len(await database.claim_notifications(42, 10, 0, 1)), 1)
+        self.assertEqual(await database.claim_notifications(42, 10, 0, 1), [])
+        self.assertEqual(await self.states(), {(1, "v1"): "dead"})
+
+    async def test_retry_is_claimed_again(self):
+        await outbox.enqueue("main", "v1", MESSAGE, [1])
+        jobs = await database.claim_notifications(42, 10, 60, 5)
+        await database.ack_notifications({"retry": [job.id for job in jobs]})
+        self.assertEqual(await self.states(), {(1, "v1"): "pending"})
+        self.assertEqual(await database.claim_notifications(42, 10, 60, 5), jobs)
+
+    async def test_renewed_lease_is_not_claimed(self):
+        await outbox.enqueue("main", "v1", MESSAGE, [1])
+        jobs = await database.claim_notifications(42, 10, 0, 5)
+        await database.renew_notifications([job.id for job in jobs], 60)
+        self.assertEqual(await database.claim_notifications(42, 10, 0, 5), [])
+
+    async def test_deliver_batch(self):
+        await outbox.enqueue("main", "v1", MESSAGE, [1, 2, 3])
+        outbox._messages.clear()
+        with patch.object(outbox.bot, "send_message", AsyncMock()) as send_message:
+            self.assertEqual(await outbox.deliver_batch(), 3)
+        self.assertEqual(send_message.await_count, 3)
+        self.assertEqual(send_message.await_args.kwargs["text"], MESSAGE["ru"])
+        self.assertEqual(set((await self.states()).values()), {"sent"})
+        self.assertEqual(await outbox.deliver_batch(), 0)
+
+    async def test_purge(self):
+        await outbox.enqueue("main", "v1", MESSAGE, [1, 2])
+        await asyncio.sleep(0.01)
+        self.assertEqual(await database.purge_notifications(0), 2)
+        self.assertEqual(await database.get_notification_messages([("main", "v1")]), {})
+
+
+class FakeSession:
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def begin(self):
+        return self
+
+    async def execute(self, stmt):
+        self.statements.append(stmt)
+        return Mock(rowcount=1)
+
+
+class TestEnqueue(IsolatedAsyncioTestCase):
+
+    async def test_recipients_are_inserted_in_chunks(self):
+        session = FakeSession()
+        with patch.object(database, "_async_session", session):
+            await database.enqueue_notifications(42, "main", "v1", MESSAGE, list(range(8001)))
+        dialect = postgresql.asyncpg.dialect()
+        inserts = [stmt for stmt in session.statements if stmt.is_insert and stmt.table.name == "Notification"]
+        self.assertEqual(len(inserts), 9)
+        for stmt in session.statements:
+            compiled = stmt.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+            self.assertLess(len(compiled.positiontup), 32767)
+
+
+class TestOutboxDelivery(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        outbox._messages.clear()
+        outbox._messages.set(("main", "v1"), MESSAGE)
+        patcher = patch.multiple(database,
+                                 get_users_lang=AsyncMock(return_value={}),
+                                 ack_notifications=AsyncMock(),
+                                 renew_notifications=AsyncMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_jobs_are_grouped_and_acked_by_result(self):
+        outbox._messages.set(("main", "v2"), {"ru": "v2", "en": "v2"})
+        outbox._messages.set(("other", "v1"), {"ru": "other", "en": "other"})
+        calls = []
+
+        async def broadcast(users_id, message, **kwargs):
+            users_id = list(users_id)
+            calls.append((message["ru"], users_id))
+            return mailer.MailingResult(delivered_users=users_id[:1],
+                                        failed_users=users_id[1:2],
+                                        blocked_users=users_id[2:])
+
+        jobs = [NotificationJob(1, 10, "main", "v1"), NotificationJob(2, 20, "main", "v1"),
+                NotificationJob(3, 30, "main", "v1"), NotificationJob(4, 10, "main", "v2"),
+                NotificationJob(5, 10, "other", "v1"), NotificationJob(6, 10, "gone", "v1")]
+        with patch.object(database, "claim_notifications", AsyncMock(return_value=jobs)), \
+                patch.object(database, "get_notification_messages", AsyncMock(return_value={})), \
+                patch.object(outbox, "remove_blocked_users", AsyncMock()) as remove_blocked_users, \
+                patch.object(outbox.mailer, "broadcast", broadcast):
+            self.assertEqual(await outbox.deliver_batch(), 6)
+        self.assertEqual(calls, [(MESSAGE["ru"], [10, 20, 30]), ("v2", [10]), ("other", [10])])
+        database.ack_notifications.assert_awaited_once_with(
+            {"sent": [1, 4, 5], "retry": [2], "failed": [6], "blocked": [3]}
+        )
+        remove_blocked_users.assert_awaited_once_with([30])
+
+    async def test_lease_is_renewed_during_batch(self):
+        async def slow_broadcast(users_id, **kwargs):
+            await asyncio.sleep(0.05)
+            return mailer.MailingResult(delivered_users=list(users_id))
+
+        jobs = [NotificationJob(1, 10, "main", "v1"), NotificationJob(2, 20, "main", "v1")]
+        with patch.object(database, "claim_notifications", AsyncMock(return_value=jobs)), \
+                patch.object(outbox.config, "OUTBOX_LEASE", 0.03), \
+                patch.object(outbox.mailer, "broadcast", slow_broadcast):
+            self.assertEqual(await outbox.deliver_batch(), 2)
+        database.renew_notifications.assert_awaited_with([1, 2], 0.03)
+        calls = database.renew_notifications.await_count
+        await asyncio.sleep(0.03)
+        self.assertEqual(database.renew_notifications.await_count, calls)
+
+
+class TestPurge(IsolatedAsyncioTestCase):
+
+    async def test_survives_unexpected_errors(self):
+        purge_notifications = AsyncMock(side_effect=[RuntimeError, 0, asyncio.CancelledError])
+        with patch.object(database, "purge_notifications", purge_notifications), \
+                patch.object(outbox.config, "OUTBOX_PURGE_INTERVAL", 0):
+            with self.assertRaises(asyncio.CancelledError):
+                await outbox.purge()
+        self.assertEqual(purge_notifications.await_count, 3)
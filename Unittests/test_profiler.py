@@ -0,0 +1,45 @@
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase
+
+from profiler import SamplingProfiler
+
+
+def busy_handler(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestSamplingProfiler(IsolatedAsyncioTestCase):
+
+    async def test_profile(self):
+        profiler = SamplingProfiler(interval=0.001)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "profiles" / "profile.folded"
+
+            async def busy():
+                for _ in range(10):
+                    busy_handler(0.01)
+                    await asyncio.sleep(0)
+
+            task = asyncio.create_task(busy())
+            samples = await profiler.profile(0.3, str(path))
+            await task
+            lines = path.read_text().splitlines()
+        self.assertGreater(samples, 0)
+        self.assertFalse(profiler.running)
+        counts = [int(line.rsplit(" ", 1)[1]) for line in lines]
+        self.assertEqual(sum(counts), samples)
+        self.assertTrue(any("busy_handler (test_profiler.py:" in line for line in lines))
+
+    async def test_single_window(self):
+        profiler = SamplingProfiler(interval=0.01)
+        with tempfile.TemporaryDirectory() as directory:
+            task = asyncio.create_task(profiler.profile(0.1, f"{directory}/first.folded"))
+            await asyncio.sleep(0)
+            with self.assertRaises(RuntimeError):
+                await profiler.profile(0.1, f"{directory}/second.folded")
+            await task
@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+from scheduler import PollScheduler
+
+
+class TestPollScheduler(TestCase):
+
+    def setUp(self):
+        self.scheduler = PollScheduler(interval=25, min_interval=10, max_interval=100,
+                                       backoff_max=400, boost_cycles=2, window=4)
+
+    def test_idle(self):
+        for _ in range(4):
+            self.scheduler.on_success(changed=False)
+        self.assertEqual(self.scheduler.interval, 100)
+
+    def test_boost_after_change(self):
+        self.assertEqual(self.scheduler.on_success(changed=True), 10)
+        self.assertEqual(self.scheduler.on_success(changed=False), 10)
+        self.assertEqual(self.scheduler.on_success(changed=False), 100 - 90 * 1 / 3)
+
+    def test_change_rate(self):
+        for changed in (True, False, True, False, False, False):
+            self.scheduler.on_success(changed)
+        self.assertEqual(self.scheduler.change_rate, 0.25)
+        self.assertEqual(self.scheduler.interval, 100 - 90 * 0.25)
+
+    def test_backoff(self):
+        delays = [self.scheduler.on_error() for _ in range(6)]
+        for failures, delay in enumerate(delays, start=1):
+            cap = min(400, 25 * 2 ** failures)
+            self.assertGreaterEqual(delay, cap / 2)
+            self.assertLessEqual(delay, cap)
+        self.scheduler.on_success(changed=False)
+        self.assertEqual(self.scheduler.failures, 0)
@@ -0,0 +1,158 @@
+import asyncio
+import os
+from types import MappingProxyType
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import AsyncMock, Mock, patch
+
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+
+import script
+import subscriptions
+from metrics import registry
+from scheduler import PollScheduler
+from webparser import MachineInfo, Snapshot
+
+
+class TestGetRecipients(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.index = subscriptions.SubscriptionIndex()
+        self.index.load([(1, 5, 42, "main"), (2, 6, 42, "main")])
+        patcher = patch.object(script.subscriptions, "index", self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_local_index_without_leader_election(self):
+        with patch.object(script.config, "LEADER_ELECTION", "off"), \
+                patch("database.get_recipients", AsyncMock()) as get_recipients:
+            self.assertEqual(await script.get_recipients("main", {5, 6}), {1, 2})
+        get_recipients.assert_not_awaited()
+
+    async def test_leader_reads_database(self):
+        with patch.object(script.config, "LEADER_ELECTION", "postgres"), \
+                patch("database.get_recipients", AsyncMock(return_value={1, 3})) as get_recipients:
+            self.assertEqual(await script.get_recipients("main", {5}), {1, 3})
+        get_recipients.assert_awaited_once_with(42, "main", [5])
+
+    async def test_leader_falls_back_to_index(self):
+        with patch.object(script.config, "LEADER_ELECTION", "postgres"), \
+                patch("database.get_recipients", AsyncMock(side_effect=ConnectionError)):
+            self.assertEqual(await script.get_recipients("main", {6}), {2})
+
+
+class TestPollMetrics(TestCase):
+
+    def test_scheduler_gauges(self):
+        scheduler = PollScheduler(interval=30, min_interval=10, max_interval=120, backoff_max=600)
+        scheduler.on_error()
+        with patch.dict(script.schedulers, {"main": scheduler}):
+            rendered = registry.render()
+        self.assertIn(f'washbot_poll_interval_seconds{{site="main"}} {scheduler.interval:g}', rendered)
+        self.assertIn('washbot_poll_failures{site="main"} 1', rendered)
+
+
+def snapshot(status: str | None) -> Snapshot:
+    return Snapshot(
+        machines=(MachineInfo(5, "washer", 100, "main"),) if status else (),
+        status=MappingProxyType({5: status} if status else {}),
+        time_last_update=(0, 0)
+    )
+
+
+class TestPollSite(IsolatedAsyncioTestCase):
+
+    async def test_enqueue_failure_falls_back_to_mailing(self):
+        mailed = asyncio.Event()
+        snapshots = [snapshot("free"), snapshot("busy")]
+
+        async def poll(poller, session):
+            if snapshots:
+                return snapshots.pop(0)
+            await asyncio.Event().wait()
+
+        scheduler = PollScheduler(interval=0, min_interval=0, max_interval=0, backoff_max=0)
+        store = Mock(publish=AsyncMock())
+        with patch.dict(script.schedulers, {"main": scheduler}), \
+                patch.dict(script.status_store.stores, {"main": store}), \
+                patch.object(script, "get_http_session"), \
+                patch.object(script, "_poll", poll), \
+                patch.object(script, "get_recipients", AsyncMock(return_value={1})), \
+                patch.object(script.database, "get_machines", AsyncMock(side_effect=ConnectionError)), \
+                patch.object(script.text, "render_status", Mock(return_value={"ru": "busy"})), \
+                patch.object(script.outbox, "enqueue", AsyncMock(side_effect=RuntimeError)), \
+                patch.object(script, "mailing", AsyncMock(side_effect=lambda **kwargs: mailed.set())) as mailing:
+            task = asyncio.create_task(script.poll_site("main"))
+            await asyncio.wait_for(mailed.wait(), 1)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self.assertEqual(mailing.call_args.kwargs["users_id"], [1])
+        self.assertEqual(mailing.call_args.kwargs["message"], {"ru": "busy"})
+
+    async def test_catalog_machines_missing_from_site_are_ignored(self):
+        enqueued = asyncio.Event()
+        snapshots = [snapshot("free"), snapshot("busy")]
+
+        async def poll(poller, session):
+            if snapshots:
+                return snapshots.pop(0)
+            await asyncio.Event().wait()
+
+        machines = [MachineInfo(5, "washer", 100, "main"), MachineInfo(99, "washer", 100, "main")]
+        scheduler = PollScheduler(interval=0, min_interval=0, max_interval=0, backoff_max=0)
+        store = Mock(publish=AsyncMock())
+        with patch.dict(script.schedulers, {"main": scheduler}), \
+                patch.dict(script.status_store.stores, {"main": store}), \
+                patch.object(script, "get_http_session"), \
+                patch.object(script, "_poll", poll), \
+                patch.object(script, "get_recipients", AsyncMock(return_value={1})) as get_recipients, \
+                patch.object(script.database, "get_machines", AsyncMock(return_value=machines)), \
+                patch.object(script.outbox, "enqueue",
+                             AsyncMock(side_effect=lambda *args: enqueued.set())) as enqueue:
+            task = asyncio.create_task(script.poll_site("main"))
+            await asyncio.wait_for(enqueued.wait(), 1)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        get_recipients.assert_awaited_once_with("main", {5})
+        self.assertIn("5", enqueue.await_args.args[2]["ru"])
+
+    async def test_initial_poll_survives_unexpected_errors(self):
+        published = asyncio.Event()
+        scheduler = PollScheduler(interval=60, min_interval=0, max_interval=60, backoff_max=0)
+        store = Mock(publish=AsyncMock(side_effect=lambda snapshot: published.set()))
+        with patch.dict(script.schedulers, {"main": scheduler}), \
+                patch.dict(script.status_store.stores, {"main": store}), \
+                patch.object(script, "get_http_session"), \
+                patch.object(script, "_poll", AsyncMock(side_effect=[ValueError, snapshot("free")])):
+            task = asyncio.create_task(script.poll_site("main"))
+            await asyncio.wait_for(published.wait(), 1)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        store.publish.assert_awaited_once()
+
+    async def test_initial_poll_retries_empty_snapshot(self):
+        scheduler = PollScheduler(interval=60, min_interval=0, max_interval=60, backoff_max=0)
+        store = Mock(publish=AsyncMock())
+        poll = AsyncMock(side_effect=[snapshot(None), snapshot("free")])
+        with patch.dict(script.schedulers, {"main": scheduler}), \
+                patch.dict(script.status_store.stores, {"main": store}), \
+                patch.object(script, "get_http_session"), \
+                patch.object(script, "_poll", poll):
+            task = asyncio.create_task(script.poll_site("main"))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self.assertEqual(poll.await_count, 2)
+        self.assertEqual(store.publish.await_args.args[0].machines, snapshot("free").machines)
+
+
+class TestRefreshCatalog(IsolatedAsyncioTestCase):
+
+    async def test_survives_unexpected_errors(self):
+        store = Mock(snapshot=snapshot("free"))
+        sync_catalog = AsyncMock(side_effect=[RuntimeError, None, asyncio.CancelledError])
+        with patch.dict(script.status_store.stores, {"main": store}, clear=True), \
+                patch.object(script.config, "CATALOG_REFRESH_TIME", 0), \
+                patch.object(script, "sync_catalog", sync_catalog):
+            with self.assertRaises(asyncio.CancelledError):
+                await script.refresh_catalog()
+        self.assertEqual(sync_catalog.await_count, 3)
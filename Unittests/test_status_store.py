@@ -0,0 +1,113 @@
+import asyncio
+import os
+from unittest import IsolatedAsyncioTestCase
+
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+
+from cashews import Cache
+
+from status_store import StatusStore
+from webparser import Snapshot
+
+
+def make_snapshot(status: str) -> Snapshot:
+    return Snapshot(machines=(), status={1: status}, time_last_update=("18.10.2026", "19:05"))
+
+
+class TestStatusStore(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.fetches = 0
+        self.fail = False
+        self.release = asyncio.Event()
+
+        async def fetch() -> Snapshot:
+            self.fetches += 1
+            await self.release.wait()
+            if self.fail:
+                raise ConnectionError("Connection error")
+            return make_snapshot(f"fetch {self.fetches}")
+
+        self.store = StatusStore(fetch=fetch, max_age=60)
+
+    async def test_coalesce_cold_misses(self):
+        readers = [asyncio.create_task(self.store.get()) for _ in range(10)]
+        await asyncio.sleep(0)
+        self.release.set()
+        results = await asyncio.gather(*readers)
+        self.assertEqual(self.fetches, 1)
+        self.assertTrue(all(snapshot.status[1] == "fetch 1" for snapshot, _ in results))
+
+    async def test_publish(self):
+        await self.store.publish(make_snapshot("poller"))
+        snapshot, age = await self.store.get()
+        self.assertEqual(snapshot.status[1], "poller")
+        self.assertLess(age, 1)
+        self.assertEqual(self.fetches, 0)
+
+    async def test_stale_while_revalidate(self):
+        await self.store.publish(make_snapshot("poller"))
+        self.store.max_age = 0
+        for _ in range(5):
+            snapshot, _ = await self.store.get()
+            self.assertEqual(snapshot.status[1], "poller")
+        await asyncio.sleep(0)
+        self.assertEqual(self.fetches, 1)
+        self.release.set()
+        await asyncio.sleep(0.01)
+        snapshot, _ = await self.store.get()
+        self.assertEqual(snapshot.status[1], "fetch 1")
+
+    async def test_cold_miss_failure(self):
+        self.fail = True
+        self.release.set()
+        with self.assertRaises(ConnectionError):
+            await self.store.get()
+
+
+class TestSharedStatusStore(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.shared = Cache()
+        self.shared.setup("mem://")
+        self.fetches = 0
+
+        async def fetch() -> Snapshot:
+            self.fetches += 1
+            await asyncio.sleep(0.05)
+            return make_snapshot(f"fetch {self.fetches}")
+
+        self.workers = [StatusStore(fetch=fetch, max_age=60, shared=self.shared) for _ in range(3)]
+
+    async def test_single_fetch(self):
+        results = await asyncio.gather(*(worker.get() for worker in self.workers))
+        self.assertEqual(self.fetches, 1)
+        self.assertTrue(all(snapshot.status[1] == "fetch 1" for snapshot, _ in results))
+
+    async def test_publish_is_shared(self):
+        snapshot = make_snapshot("poller")
+        await self.workers[0].publish(snapshot)
+        shared, age = await self.workers[1].get()
+        self.assertEqual(shared, snapshot)
+        self.assertEqual(shared.version, snapshot.version)
+        self.assertEqual(self.fetches, 0)
+
+    async def test_follower_sees_newer_publish(self):
+        leader, follower = self.workers[:2]
+        await leader.publish(make_snapshot("busy"))
+        self.assertEqual((await follower.get())[0].status[1], "busy")
+        await asyncio.sleep(0.01)
+        await leader.publish(make_snapshot("free"))
+        self.assertEqual((await follower.get())[0].status[1], "free")
+        self.assertEqual(self.fetches, 0)
+
+    async def test_shared_key_is_checked_after_local_ttl(self):
+        leader, follower = self.workers[:2]
+        follower.shared_ttl = 60
+        await leader.publish(make_snapshot("busy"))
+        await follower.get()
+        await asyncio.sleep(0.01)
+        await leader.publish(make_snapshot("free"))
+        self.assertEqual((await follower.get())[0].status[1], "busy")
+        follower._checked -= 61
+        self.assertEqual((await follower.get())[0].status[1], "free")
@@ -0,0 +1,36 @@
+from unittest import TestCase
+
+from subscriptions import SubscriptionIndex
+
+
+class TestSubscriptionIndex(TestCase):
+
+    def setUp(self):
+        self.index = SubscriptionIndex()
+        self.index.load([(10, 1, 7, "a"), (11, 1, 7, "a"), (10, 2, 7, "a"), (12, 3, 7, "a"),
+                         (13, 1, 8, "a"), (14, 1, 7, "b")])
+
+    def test_load(self):
+        self.assertTrue(self.index.loaded)
+        self.assertEqual(len(self.index), 6)
+        self.assertEqual(self.index.get_sub_users(1, 7, "a"), (10, 11))
+
+    def test_recipients(self):
+        self.assertEqual(self.index.recipients(7, "a", {1, 2}), {10, 11})
+        self.assertEqual(self.index.recipients(7, "a", {3, 4}), {12})
+        self.assertEqual(self.index.recipients(7, "b", {1, 2}), {14})
+        self.assertEqual(self.index.recipients(8, "a", {1}), {13})
+        self.assertEqual(self.index.recipients(9, "a", {1}), set())
+
+    def test_add_remove(self):
+        self.index.add(5, 1, 7, "a")
+        self.index.add(5, 1, 7, "a")
+        self.assertEqual(self.index.get_sub_users(1, 7, "a"), (5, 10, 11))
+        self.index.remove(10, 1, 7, "a")
+        self.index.remove(10, 4, 7, "a")
+        self.assertEqual(self.index.get_sub_users(1, 7, "a"), (5, 11))
+
+    def test_remove_user(self):
+        self.index.remove_user(10)
+        self.assertEqual(self.index.recipients(7, "a", {1, 2, 3}), {11, 12})
+        self.assertEqual(self.index.get_sub_users(2, 7, "a"), ())
@@ -0,0 +1,76 @@
+import os
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+
+import status_store
+import text
+import webparser
+from status_store import StatusStore
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+class TestStatusRenderer(TestCase):
+
+    def setUp(self):
+        with open(FIXTURES / "laundry.html", encoding="utf8") as file:
+            self.html = file.read()
+        self.renderer = text.StatusRenderer()
+
+    def test_render(self):
+        report = self.renderer.render(webparser.parse_snapshot(self.html))
+        self.assertTrue(report["ru"].startswith("Состояние машин 18.10.2026 в 19:05:\n"))
+        self.assertIn("🟢 СТИРКА 1 - Свободно\n", report["ru"])
+        self.assertIn("🔴 CAPSULE 3 - Paid for\n", report["en"])
+
+    def test_cached_by_version(self):
+        report = self.renderer.render(webparser.parse_snapshot(self.html))
+        self.assertIs(self.renderer.render(webparser.parse_snapshot(self.html)), report)
+        self.assertEqual((self.renderer.hits, self.renderer.misses), (1, 1))
+
+    def test_rerender_changed_lines(self):
+        self.renderer.render(webparser.parse_snapshot(self.html))
+        report = self.renderer.render(webparser.parse_snapshot(self.html.replace("Занято", "Свободно")))
+        self.assertIn("🟢 WASHING 2 - Freely\n", report["en"])
+        self.assertEqual(self.renderer.misses, 2)
+
+    def test_machines_missing_from_site_are_skipped(self):
+        snapshot = webparser.parse_snapshot(self.html)
+        machines = snapshot.machines + (webparser.MachineInfo(99, "СТИРКА", 100),)
+        report = self.renderer.render(snapshot, machines)
+        self.assertEqual(report, text.StatusRenderer().render(snapshot))
+
+    def test_title(self):
+        report = text.StatusRenderer(title="Общежитие 2").render(webparser.parse_snapshot(self.html))
+        self.assertTrue(report["en"].startswith("🏠 Общежитие 2\nStatus of machines"))
+
+
+class TestGetStatus(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        with open(FIXTURES / "laundry.html", encoding="utf8") as file:
+            snapshot = webparser.parse_snapshot(file.read())
+
+        async def fetch():
+            return snapshot
+
+        async def fail():
+            raise ConnectionError("Connection error")
+
+        self.stores = {"a": StatusStore(fetch=fetch, max_age=60), "b": StatusStore(fetch=fail, max_age=60)}
+        self.renderers = {"a": text.StatusRenderer(title="a"), "b": text.StatusRenderer(title="b")}
+
+    async def test_site_unavailable(self):
+        with patch.dict(status_store.stores, self.stores, clear=True), \
+                patch.dict(text.renderers, self.renderers, clear=True):
+            report = await text.get_status()
+        self.assertTrue(report["ru"].startswith("🏠 a\nСостояние машин"))
+        self.assertTrue(report["ru"].endswith("🏠 b: сайт недоступен\n"))
+
+    async def test_all_sites_unavailable(self):
+        with patch.dict(status_store.stores, {"b": self.stores["b"]}, clear=True):
+            with self.assertRaises(ConnectionError):
+                await text.get_status()
@@ -0,0 +1,54 @@
+import os
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, Mock, patch
+
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+
+from sqlalchemy.exc import IntegrityError
+
+import catalog
+import subscriptions
+import text
+import user_handlers
+from webparser import MachineInfo
+
+
+class TestCallbackSubs(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.catalog = catalog.Catalog([MachineInfo(seq_num, "washer", 100, "main") for seq_num in (1, 2, 3)])
+        self.index = subscriptions.SubscriptionIndex()
+        self.index.load([(10, 1, 42, "main"), (10, 2, 42, "main")])
+        self.callback = Mock(from_user=Mock(id=10),
+                             answer=AsyncMock(),
+                             message=Mock(delete=AsyncMock(), answer=AsyncMock()))
+        self.state = Mock(get_data=AsyncMock(return_value={
+            "v": self.catalog.version,
+            "s": self.catalog.to_mask([("main", 2), ("main", 3)]),
+            "o": self.catalog.to_mask([("main", 1), ("main", 2)])
+        }), clear=AsyncMock())
+        for patcher in (patch.object(user_handlers.database, "get_user_lang", AsyncMock(return_value="ru")),
+                        patch.object(user_handlers.catalog, "get_catalog_version",
+                                     AsyncMock(return_value=self.catalog)),
+                        patch.object(user_handlers.subscriptions, "index", self.index)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def recipients(self, seq_num: int) -> set[int]:
+        return self.index.recipients(42, "main", {seq_num})
+
+    async def test_applies_diff_and_updates_index(self):
+        subs = (("main", 2), ("main", 3))
+        with patch.object(user_handlers.database, "apply_sub_diff", AsyncMock(return_value=subs)) as apply_sub_diff:
+            await user_handlers.callback_subs(self.callback, self.state)
+        apply_sub_diff.assert_awaited_once_with(10, 42, [("main", 3)], [("main", 1)])
+        self.assertEqual([self.recipients(seq_num) for seq_num in (1, 2, 3)], [set(), {10}, {10}])
+        self.state.clear.assert_awaited_once()
+
+    async def test_integrity_error_answers_outdated(self):
+        error = IntegrityError("INSERT", {}, Exception("foreign key"))
+        with patch.object(user_handlers.database, "apply_sub_diff", AsyncMock(side_effect=error)):
+            await user_handlers.callback_subs(self.callback, self.state)
+        self.assertEqual(self.callback.message.answer.await_args.kwargs["text"], text.sub["outdated"]["ru"])
+        self.assertEqual([self.recipients(seq_num) for seq_num in (1, 2, 3)], [{10}, {10}, set()])
+        self.state.clear.assert_awaited_once()
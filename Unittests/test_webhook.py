@@ -0,0 +1,105 @@
+import asyncio
+import json
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import webhook
+from webhook import WebhookHandler
+
+FIXTURES = Path(__file__).parent / "fixtures"
+SECRET = "secret"
+
+
+class TestWebhookHandler(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.update = json.loads((FIXTURES / "update_message.json").read_text())
+        self.received = []
+        self.release = asyncio.Event()
+        self.running = 0
+        self.max_running = 0
+        router = Router()
+
+        @router.message()
+        async def on_message(message: Message):
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            await self.release.wait()
+            self.received.append(message.text)
+            self.running -= 1
+
+        dp = Dispatcher()
+        dp.include_router(router)
+        self.bot = Bot("42:TEST")
+        self.handler = WebhookHandler(dp, self.bot, secret_token=SECRET, concurrency=2, queue_size=8)
+        app = web.Application()
+        app.router.add_post("/webhook", self.handler.handle)
+        self.client = TestClient(TestServer(app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.handler.close()
+        await self.client.close()
+        await self.bot.session.close()
+
+    async def post(self, update, secret=SECRET):
+        return await self.client.post("/webhook", json=update,
+                                      headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+
+    async def test_wrong_secret(self):
+        response = await self.post(self.update, secret="wrong")
+        self.assertEqual(response.status, 401)
+        self.assertFalse(self.handler._tasks)
+
+    async def test_invalid_update(self):
+        response = await self.post({"message": "broken"})
+        self.assertEqual(response.status, 400)
+
+    async def test_answer_before_processing(self):
+        response = await self.post(self.update)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.received, [])
+        self.release.set()
+        await asyncio.gather(*self.handler._tasks)
+        self.assertEqual(self.received, ["/start"])
+
+    async def test_concurrency_limit(self):
+        for update_id in range(5):
+            response = await self.post(dict(self.update, update_id=update_id))
+            self.assertEqual(response.status, 200)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.max_running, 2)
+        self.release.set()
+        await asyncio.gather(*self.handler._tasks)
+        self.assertEqual(len(self.received), 5)
+
+    async def test_queue_limit(self):
+        self.handler.queue_size = 3
+        statuses = []
+        for update_id in range(5):
+            response = await self.post(dict(self.update, update_id=update_id))
+            statuses.append(response.status)
+        self.assertEqual(statuses, [200, 200, 200, 503, 503])
+        self.release.set()
+        await asyncio.gather(*self.handler._tasks)
+        self.assertEqual(len(self.received), 3)
+        response = await self.post(dict(self.update, update_id=5))
+        self.assertEqual(response.status, 200)
+
+
+class TestWebhookConfig(TestCase):
+
+    def test_secret_is_required(self):
+        with patch.multiple(webhook.config, WEBHOOK_URL="https://example.org", WEBHOOK_SECRET=None):
+            with self.assertRaises(ValueError):
+                webhook.check_config()
+        with patch.multiple(webhook.config, WEBHOOK_URL="https://example.org", WEBHOOK_SECRET=SECRET):
+            webhook.check_config()
+        with patch.multiple(webhook.config, WEBHOOK_URL=None, WEBHOOK_SECRET=None):
+            webhook.check_config()
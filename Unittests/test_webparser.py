@@ -1,9 +1,14 @@
-from unittest import IsolatedAsyncioTestCase
+import asyncio
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase, TestCase
 
-from aiohttp import ClientSession
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
 
 import webparser
 
+FIXTURES = Path(__file__).parent / "fixtures"
+
 
 class TestWebParser(IsolatedAsyncioTestCase):
 
@@ -29,3 +34,134 @@ class TestWebParser(IsolatedAsyncioTestCase):
                     print(machine)
             except ConnectionError:
                 pass
+
+
+class TestParseSnapshot(TestCase):
+
+    def setUp(self):
+        with open(FIXTURES / "laundry.html", encoding="utf8") as file:
+            self.html = file.read()
+
+    def test_parse_snapshot(self):
+        snapshot = webparser.parse_snapshot(self.html)
+        self.assertEqual([machine.seq_num for machine in snapshot.machines], [1, 2, 3, 4, 5])
+        self.assertEqual(snapshot.machines[2], webparser.MachineInfo(seq_num=3, type="КАПСУЛА", prise=150))
+        self.assertEqual(snapshot.status[1], "Свободно")
+        self.assertEqual(snapshot.status[4], "В ремонте")
+        self.assertEqual(snapshot.time_last_update, ("18.10.2026", "19:05"))
+
+    def test_snapshot_is_immutable(self):
+        snapshot = webparser.parse_snapshot(self.html)
+        with self.assertRaises(TypeError):
+            snapshot.status[1] = "Занято"
+        with self.assertRaises(AttributeError):
+            snapshot.status = {}
+
+    def test_parse_snapshot_without_machines(self):
+        snapshot = webparser.parse_snapshot("<html><body></body></html>")
+        self.assertEqual(snapshot.machines, ())
+        self.assertEqual(dict(snapshot.status), {})
+        self.assertEqual(snapshot.time_last_update, ())
+
+
+class TestSitePoller(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        with open(FIXTURES / "laundry.html", encoding="utf8") as file:
+            self.html = file.read()
+        self.etag = None
+
+        async def handler(request: web.Request) -> web.Response:
+            if self.etag and request.headers.get("If-None-Match") == self.etag:
+                return web.Response(status=304)
+            headers = {"ETag": self.etag} if self.etag else {}
+            return web.Response(text=self.html, content_type="text/html", headers=headers)
+
+        app = web.Application()
+        app.router.add_get("/", handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.session = ClientSession()
+        self.poller = webparser.SitePoller(str(self.server.make_url("/")))
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.server.close()
+
+    async def test_not_modified(self):
+        self.etag = '"v1"'
+        snapshot = await self.poller.poll(self.session)
+        self.assertIs(await self.poller.poll(self.session), snapshot)
+        self.assertEqual(self.poller.stats(), {"not_modified": 1, "hash_hits": 0, "full_parses": 1})
+
+    async def test_hash_hit(self):
+        snapshot = await self.poller.poll(self.session)
+        self.assertIs(await self.poller.poll(self.session), snapshot)
+        self.html = self.html.replace("Занято", "Свободно")
+        changed = await self.poller.poll(self.session)
+        self.assertEqual(changed.status[2], "Свободно")
+        self.assertEqual(self.poller.stats(), {"not_modified": 0, "hash_hits": 1, "full_parses": 2})
+
+    async def test_fetch_metrics_are_labelled_by_site(self):
+        before = webparser.fetch_seconds.count(site=self.poller.site)
+        await self.poller.poll(self.session)
+        self.assertEqual(webparser.fetch_seconds.count(site=self.poller.site), before + 1)
+        self.assertNotIn(self.poller.url, "\n".join(webparser.fetch_seconds.render()))
+
+
+class TestParserBackends(TestCase):
+
+    def setUp(self):
+        with open(FIXTURES / "laundry.html", encoding="utf8") as file:
+            self.html = file.read()
+
+    def assertBackendsEqual(self, html):
+        self.assertEqual(webparser.parse_snapshot(html, "bs4"), webparser.parse_snapshot(html, "lxml"))
+
+    def test_fixture(self):
+        self.assertBackendsEqual(self.html)
+
+    def test_whitespace_and_extra_classes(self):
+        html = (self.html
+                .replace("col mb-3 childItem child2", "col  mb-3\tchildItem child2 active")
+                .replace('"text-center h3"', '" h3  text-center"')
+                .replace("Свободно", "<b>Свободно</b> <!-- cached -->"))
+        self.assertBackendsEqual(html)
+
+    def test_missing_information(self):
+        self.assertBackendsEqual(self.html.replace("pl-1 pr-1 withTooltip", "price"))
+        self.assertBackendsEqual(self.html.replace('data-toggle="tooltip"', ""))
+        self.assertBackendsEqual("<html><body></body></html>")
+
+
+class TestParserExecutor(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        with open(FIXTURES / "laundry.html", encoding="utf8") as file:
+            self.html = file.read()
+        self.expected = webparser.parse_snapshot(self.html, site="b")
+
+    async def check_executor(self, kind: str):
+        parser = webparser.ParserExecutor(kind=kind, workers=2)
+        try:
+            snapshots = await asyncio.gather(*(parser.parse(self.html, site="b") for _ in range(4)))
+        finally:
+            parser.shutdown()
+        for snapshot in snapshots:
+            self.assertEqual(snapshot, self.expected)
+            self.assertEqual(snapshot.version, self.expected.version)
+        stats = parser.stats()
+        self.assertEqual(stats["parses"], 4)
+        self.assertEqual(stats["pending"], 0)
+        self.assertEqual(stats["max_pending"], 1 if kind == "inline" else 4)
+        self.assertGreater(stats["max_latency"], 0)
+        self.assertGreaterEqual(stats["max_latency"], stats["max_parse_time"])
+
+    async def test_inline(self):
+        await self.check_executor("inline")
+
+    async def test_thread(self):
+        await self.check_executor("thread")
+
+    async def test_process(self):
+        await self.check_executor("process")
@@ -0,0 +1,53 @@
+import logging
+
+from aiogram import Router, F
+from aiogram.exceptions import TelegramAPIError
+from aiogram.filters import Command, CommandObject, Filter
+from aiogram.types import Message, FSInputFile
+
+import config
+import database
+import script
+from database import Admin
+from profiler import profiler, profile_path
+from service import bot
+
+logger = logging.getLogger(__name__)
+router_admin = Router()
+router_admin.message.filter(F.chat.type == "private")
+
+
+class IsAdmin(Filter):
+    async def __call__(self, message: Message) -> bool:
+        try:
+            return await database.get_by_id(Admin, message.from_user.id) is not None
+        except ConnectionError:
+            return False
+
+
+async def _profile(chat_id: int, seconds: float) -> None:
+    path = profile_path()
+    try:
+        samples = await profiler.profile(seconds, path)
+        await bot.send_document(chat_id=chat_id,
+                                document=FSInputFile(path),
+                                caption=f"{samples} samples, {path}")
+    except RuntimeError:
+        await bot.send_message(chat_id=chat_id, text="Profiling is already running")
+    except TelegramAPIError:
+        logger.error(f"Profile {path} has not been sent", exc_info=True)
+
+
+@router_admin.message(Command("profile"), IsAdmin())
+async def command_profile(message: Message, command: CommandObject) -> None:
+    try:
+        seconds = float(command.args) if command.args else config.PROFILE_DEFAULT_TIME
+    except ValueError:
+        await message.answer(text="Usage: /profile [seconds]")
+        return
+    seconds = min(max(seconds, 1.0), config.PROFILE_MAX_TIME)
+    if profiler.running:
+        await message.answer(text="Profiling is already running")
+        return
+    await message.answer(text=f"Profiling the event loop for {seconds:g} seconds")
+    script._run_in_background(_profile(message.chat.id, seconds))
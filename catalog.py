@@ -0,0 +1,64 @@
+import hashlib
+import logging
+import time
+from typing import Iterable
+
+import config
+import database
+from lru import LRUCache
+from webparser import MachineInfo
+
+logger = logging.getLogger(__name__)
+
+
+class Catalog:
+    def __init__(self, machines: Iterable[MachineInfo]) -> None:
+        self.machines = tuple(machines)
+        self.positions = {(machine.site, machine.seq_num): pos for pos, machine in enumerate(self.machines)}
+        self.version = hashlib.blake2b(repr(self.machines).encode(), digest_size=8).hexdigest()
+
+    def to_mask(self, subs: Iterable[tuple[str, int]]) -> int:
+        mask = 0
+        for sub in subs:
+            pos = self.positions.get(sub)
+            if pos is not None:
+                mask |= 1 << pos
+        return mask
+
+    def to_subs(self, mask: int) -> list[tuple[str, int]]:
+        return [(machine.site, machine.seq_num) for pos, machine in enumerate(self.machines)
+                if mask >> pos & 1]
+
+    def toggle(self, mask: int, site: str, seq_num: int) -> int:
+        return mask ^ 1 << self.positions[(site, seq_num)]
+
+
+_current: dict[int, tuple[float, Catalog]] = {}
+_versions = LRUCache(maxsize=config.CATALOG_VERSIONS)
+
+
+async def get_catalog(bot_id: int) -> Catalog:
+    cached = _current.get(bot_id)
+    if cached is not None and time.monotonic() - cached[0] < config.CATALOG_CACHE_TTL:
+        return cached[1]
+    machines = await database.get_machines(bot_id)
+    catalog = Catalog(MachineInfo(seq_num=machine.seq_num, type=machine.type, prise=machine.prise, site=machine.site)
+                      for machine in machines)
+    _current[bot_id] = (time.monotonic(), catalog)
+    if catalog.version not in _versions:
+        logger.info(f"Load catalog version {catalog.version}: {len(catalog.machines)} machines")
+    _versions.set(catalog.version, catalog)
+    return catalog
+
+
+async def get_catalog_version(bot_id: int, version: str) -> Catalog | None:
+    catalog = _versions.get(version)
+    if catalog is None:
+        catalog = await get_catalog(bot_id)
+        if catalog.version != version:
+            return None
+    return catalog
+
+
+def invalidate() -> None:
+    _current.clear()
@@ -1,10 +1,76 @@
 import os
 
 SITE_URL = os.getenv("SITE_URL")
+SITES = dict(site.split("=", 1) for site in os.getenv("SITES", "").split(",") if site) or {"main": SITE_URL}
+DEFAULT_SITE = next(iter(SITES))
+for _site in SITES:
+    if len(f"m{_site}:{2 ** 31}".encode()) > 64:
+        raise ValueError(f"Site name {_site} does not fit into Telegram callback data")
+SITE_URL = SITE_URL or SITES[DEFAULT_SITE]
+SITE_CONCURRENCY = int(os.getenv("SITE_CONCURRENCY", 4))
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 DB_URL = os.getenv("DB_URL")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 10000))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", 600))
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", 32))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 256))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+SLOW_UPDATE_THRESHOLD = float(os.getenv("SLOW_UPDATE_THRESHOLD", 1))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))
+PROFILE_DEFAULT_TIME = float(os.getenv("PROFILE_DEFAULT_TIME", 10))
+PROFILE_MAX_TIME = float(os.getenv("PROFILE_MAX_TIME", 60))
 TECH_SUPPORT = "https://t.me/someone_disha015"
-STATUS_TTL = "10s"
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 10))
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", 4))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", 300))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 60))
+PARSER_BACKEND = os.getenv("PARSER_BACKEND", "bs4")
+PARSER_EXECUTOR = os.getenv("PARSER_EXECUTOR", "thread")
+PARSER_WORKERS = int(os.getenv("PARSER_WORKERS", 2))
+CACHE_URL = os.getenv("CACHE_URL", "mem://")
+CACHE_SHARED = not CACHE_URL.startswith("mem://")
+FSM_STORAGE_URL = os.getenv("FSM_STORAGE_URL", "memory://")
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", 86400))
+SHARED_SNAPSHOT_TTL = int(os.getenv("SHARED_SNAPSHOT_TTL", 300))
+SHARED_LOCK_TTL = float(os.getenv("SHARED_LOCK_TTL", 15))
 DEFAULT_LANG = "ru"
 LANGUAGES = ["ru", "en"]
 UPDATE_TIME = 25
+UPDATE_TIME_MIN = float(os.getenv("UPDATE_TIME_MIN", 10))
+UPDATE_TIME_MAX = float(os.getenv("UPDATE_TIME_MAX", 120))
+STATUS_TTL = max(int(os.getenv("STATUS_TTL", 30)), int(UPDATE_TIME_MAX + UPDATE_TIME_MIN))
+UPDATE_BACKOFF_MAX = float(os.getenv("UPDATE_BACKOFF_MAX", 600))
+UPDATE_BOOST_CYCLES = int(os.getenv("UPDATE_BOOST_CYCLES", 3))
+UPDATE_RATE_WINDOW = int(os.getenv("UPDATE_RATE_WINDOW", 20))
+LEADER_ELECTION = os.getenv("LEADER_ELECTION", "off")
+LEADER_LOCK_KEY = int(os.getenv("LEADER_LOCK_KEY", 7_143_912_402))
+LEADER_LOCK_PATH = os.getenv("LEADER_LOCK_PATH", "/tmp/washbot.leader.lock")
+LEADER_RETRY_INTERVAL = float(os.getenv("LEADER_RETRY_INTERVAL", 5))
+LEADER_CHECK_INTERVAL = float(os.getenv("LEADER_CHECK_INTERVAL", 5))
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", 60))
+CATALOG_VERSIONS = int(os.getenv("CATALOG_VERSIONS", 8))
+KEYBOARD_CACHE_SIZE = int(os.getenv("KEYBOARD_CACHE_SIZE", 4096))
+CATALOG_REFRESH_TIME = int(os.getenv("CATALOG_REFRESH_TIME", 3600))
+MAILING_RATE = int(os.getenv("MAILING_RATE", 25))
+MAILING_CHAT_INTERVAL = float(os.getenv("MAILING_CHAT_INTERVAL", 1))
+MAILING_WORKERS = int(os.getenv("MAILING_WORKERS", 16))
+MAILING_RETRIES = int(os.getenv("MAILING_RETRIES", 3))
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 2))
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", 100))
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", 60))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 5))
+OUTBOX_RETENTION = float(os.getenv("OUTBOX_RETENTION", 86400))
+OUTBOX_PURGE_INTERVAL = float(os.getenv("OUTBOX_PURGE_INTERVAL", 3600))
@@ -1,14 +1,17 @@
 import functools
 import logging
-from typing import Any, Sequence
+import time
+from datetime import timedelta
+from typing import Any, NamedTuple, Sequence
 
 from sqlalchemy import Column
-from sqlalchemy import ForeignKey, ForeignKeyConstraint
-from sqlalchemy import Integer, BigInteger, String
-from sqlalchemy import select, update, delete
+from sqlalchemy import ForeignKey, ForeignKeyConstraint, Index, Identity, UniqueConstraint
+from sqlalchemy import Integer, BigInteger, String, DateTime
+from sqlalchemy import select, update, delete, or_, func, text, tuple_
+from sqlalchemy.dialects.postgresql import insert, JSONB
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.exc import InvalidRequestError
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import DeclarativeBase
@@ -16,6 +19,8 @@ from sqlalchemy.orm import relationship
 from sqlalchemy.orm.exc import UnmappedInstanceError
 
 import config
+from lru import LRUCache
+from metrics import registry
 
 logger = logging.getLogger(__name__)
 
@@ -51,6 +56,7 @@ class Machine(Base):
     __tablename__ = "Machine"
     seq_num = Column(Integer, primary_key=True)
     bot_id = Column(ForeignKey(Bot.id), primary_key=True)
+    site = Column(String, primary_key=True, default=config.DEFAULT_SITE)
     type = Column(String)
     prise = Column(Integer)
     sub = relationship("Sub", cascade="all,delete", backref="Machine")
@@ -58,27 +64,111 @@ class Machine(Base):
 
 class Sub(Base):
     __tablename__ = "Sub"
+    __table_args__ = (
+        Index("ix_Sub_fanout", "bot_id", "site", "seq_num", postgresql_include=["user_id"]),
+    )
     user_id = Column(ForeignKey(User.id), primary_key=True)
     seq_num: Column = Column(Integer, primary_key=True)
     bot_id: Column = Column(BigInteger, primary_key=True)
-    machine_id = ForeignKeyConstraint([seq_num, bot_id], [Machine.seq_num, Machine.bot_id])
+    site: Column = Column(String, primary_key=True, default=config.DEFAULT_SITE)
+    machine_id = ForeignKeyConstraint([seq_num, bot_id, site], [Machine.seq_num, Machine.bot_id, Machine.site])
+
+
+class NotificationMessage(Base):
+    __tablename__ = "NotificationMessage"
+    site = Column(String, primary_key=True)
+    version = Column(String, primary_key=True)
+    message = Column(JSONB)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class Notification(Base):
+    __tablename__ = "Notification"
+    __table_args__ = (
+        UniqueConstraint("user_id", "bot_id", "site", "version", name="uq_Notification_user_version"),
+        Index("ix_Notification_pending", "bot_id", "id", postgresql_where=text("state = 'pending'")),
+    )
+    id = Column(BigInteger, Identity(), primary_key=True)
+    bot_id = Column(BigInteger, nullable=False)
+    user_id = Column(BigInteger, nullable=False)
+    site = Column(String, nullable=False)
+    version = Column(String, nullable=False)
+    state = Column(String, nullable=False, server_default="pending")
+    attempts = Column(Integer, nullable=False, server_default="0")
+    lease_until = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class NotificationJob(NamedTuple):
+    id: int
+    user_id: int
+    site: str
+    version: str
+
+
+class SchemaVersion(Base):
+    __tablename__ = "SchemaVersion"
+    version = Column(Integer, primary_key=True)
+    name = Column(String)
+    applied_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class UserProfile(NamedTuple):
+    lang: str
+    bot_id: int
+
+
+_MISSING = object()
+_ENQUEUE_CHUNK = 1000
+profiles = LRUCache(maxsize=config.PROFILE_CACHE_SIZE, ttl=config.PROFILE_CACHE_TTL)
+registry.track_cache("profiles", profiles)
+query_seconds = registry.histogram("washbot_db_query_seconds", "Database function latency", ["function"])
+query_errors = registry.counter("washbot_db_errors_total", "Database function failures", ["function"])
+_engine: AsyncEngine | None = None
+_async_session: async_sessionmaker[AsyncSession] | None = None
+
+
+def _get_sessionmaker() -> async_sessionmaker[AsyncSession]:
+    global _engine, _async_session
+    if _async_session is None:
+        _engine = create_async_engine(
+            config.DB_URL,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=config.DB_POOL_PRE_PING
+        )
+        _async_session = async_sessionmaker(_engine, expire_on_commit=False)
+        logger.debug(f"Create async engine {config.DB_URL}")
+    return _async_session
+
+
+def get_engine() -> AsyncEngine:
+    _get_sessionmaker()
+    return _engine
+
+
+async def dispose() -> None:
+    global _engine, _async_session
+    if _engine is not None:
+        await _engine.dispose()
+        logger.debug("Dispose async engine")
+    _engine = None
+    _async_session = None
 
 
 def connect(func) -> Any:
     @functools.wraps(func)
     async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
         try:
-            engine = create_async_engine(config.DB_URL)
-            async with engine.begin() as conn:
-                await conn.run_sync(Base.metadata.create_all)
-            async_session = async_sessionmaker(engine, expire_on_commit=False)
-            logger.debug(f"Create async engine {config.DB_URL}")
-            result = await func(async_session, *args, **kwargs)
-            await engine.dispose()
-            return result
+            return await func(_get_sessionmaker(), *args, **kwargs)
         except OSError as exc:
             logger.error("No connection to database")
+            query_errors.inc(function=func.__name__)
             raise ConnectionError("No connection to database") from exc
+        finally:
+            query_seconds.observe(time.perf_counter() - start, function=func.__name__)
 
     return wrapper
 
@@ -92,8 +182,12 @@ async def add_object(_async_session: async_sessionmaker[AsyncSession],
         try:
             await session.commit()
             logger.info(f"Add {obj.__tablename__} with id ?")
+            if isinstance(obj, User):
+                profiles.set(obj.id, UserProfile(lang=obj.lang, bot_id=obj.bot_id))
         except IntegrityError:
             logger.error(f"{obj.__tablename__} with id ? is already exists")
+            if isinstance(obj, User):
+                profiles.pop(obj.id)
 
 
 @connect
@@ -107,6 +201,10 @@ async def remove_by_id(_async_session: async_sessionmaker[AsyncSession],
             await session.delete(obj)
             await session.commit()
             logger.info(f"Remove object from table {obj_type.__tablename__}: id {obj_id}")
+            if obj_type is User:
+                profiles.pop(obj_id)
+            elif obj_type is Bot:
+                profiles.clear()
         except UnmappedInstanceError:
             logger.error(f"Remove object from table {obj_type.__tablename__}: object with id {obj_id} not found")
 
@@ -138,17 +236,53 @@ async def set_user_lang(_async_session: async_sessionmaker[AsyncSession],
         await session.execute(stmt)
         await session.commit()
         logger.info(f"Changing the language of a user with an id {user_id} {lang}")
+    _update_profile(user_id, lang=lang)
+
+
+def _update_profile(user_id: int, **values) -> None:
+    profile = profiles.get(user_id, _MISSING)
+    if profile is _MISSING:
+        return
+    if profile is None:
+        profiles.pop(user_id)
+    else:
+        profiles.set(user_id, profile._replace(**values))
 
 
 @connect
-async def get_user_lang(_async_session: async_sessionmaker[AsyncSession],
-                        user_id: int
-                        ) -> str:
-    stmt = (select(User.lang)
+async def _select_user_profile(_async_session: async_sessionmaker[AsyncSession],
+                               user_id: int
+                               ) -> UserProfile | None:
+    stmt = (select(User.lang, User.bot_id)
             .where(User.id == user_id))
     async with _async_session() as session:
         result = await session.execute(stmt)
-        return result.scalar()
+        row = result.first()
+        return UserProfile(lang=row.lang, bot_id=row.bot_id) if row else None
+
+
+async def get_user_profile(user_id: int) -> UserProfile | None:
+    profile = profiles.get(user_id, _MISSING)
+    if profile is _MISSING:
+        profile = await _select_user_profile(user_id)
+        profiles.set(user_id, profile)
+    return profile
+
+
+async def get_user_lang(user_id: int) -> str:
+    profile = await get_user_profile(user_id)
+    return profile.lang if profile else None
+
+
+@connect
+async def get_users_lang(_async_session: async_sessionmaker[AsyncSession],
+                         users_id: Sequence[int]
+                         ) -> dict[int: str]:
+    stmt = (select(User.id, User.lang)
+            .where(User.id.in_(users_id)))
+    async with _async_session() as session:
+        result = await session.execute(stmt)
+        return {user_id: lang for user_id, lang in result.all()}
 
 
 @connect
@@ -157,38 +291,124 @@ async def get_machines(_async_session: async_sessionmaker[AsyncSession],
                        ) -> Sequence[Machine]:
     stmt = (select(Machine)
             .where(Machine.bot_id == bot_id)
-            .order_by(Machine.seq_num))
+            .order_by(Machine.site, Machine.seq_num))
     async with _async_session() as session:
         machines = await session.scalars(stmt)
         return machines.all()
 
 
+@connect
+async def upsert_machines(_async_session: async_sessionmaker[AsyncSession],
+                          bot_id: int,
+                          machines: Sequence[Machine]
+                          ) -> int:
+    if not machines:
+        return 0
+    stmt = insert(Machine).values([
+        {"seq_num": machine.seq_num, "bot_id": bot_id, "site": machine.site,
+         "type": machine.type, "prise": machine.prise}
+        for machine in machines
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Machine.seq_num, Machine.bot_id, Machine.site],
+        set_={"type": stmt.excluded.type, "prise": stmt.excluded.prise},
+        where=or_(Machine.type.is_distinct_from(stmt.excluded.type),
+                  Machine.prise.is_distinct_from(stmt.excluded.prise))
+    )
+    async with _async_session() as session:
+        result = await session.execute(stmt)
+        await session.commit()
+        logger.info(f"Upsert machines of Bot {bot_id}: {result.rowcount} rows changed")
+        return result.rowcount
+
+
 @connect
 async def get_user_subs(_async_session: async_sessionmaker[AsyncSession],
                         user_id: int
-                        ) -> tuple[int]:
-    stmt = (select(Sub.seq_num)
+                        ) -> tuple[tuple[str, int]]:
+    stmt = (select(Sub.site, Sub.seq_num)
             .where(Sub.user_id == user_id)
-            .order_by(Sub.seq_num))
+            .order_by(Sub.site, Sub.seq_num))
     async with _async_session() as session:
-        subs = await session.scalars(stmt)
-        return tuple(subs.all())
+        subs = await session.execute(stmt)
+        return tuple(tuple(sub) for sub in subs.all())
 
 
 @connect
 async def get_sub_users(_async_session: async_sessionmaker[AsyncSession],
                         seq_num: int,
-                        bot_id: int
+                        bot_id: int,
+                        site: str = config.DEFAULT_SITE
                         ) -> tuple[int]:
     stmt = (select(Sub.user_id)
             .where(Sub.seq_num == seq_num)
             .where(Sub.bot_id == bot_id)
+            .where(Sub.site == site)
             .order_by(Sub.user_id))
     async with _async_session() as session:
         users_id = await session.scalars(stmt)
         return tuple(users_id.all())
 
 
+@connect
+async def get_recipients(_async_session: async_sessionmaker[AsyncSession],
+                         bot_id: int,
+                         site: str,
+                         seq_nums: Sequence[int]
+                         ) -> set[int]:
+    stmt = (select(Sub.user_id)
+            .where(Sub.bot_id == bot_id)
+            .where(Sub.site == site)
+            .where(Sub.seq_num.in_(seq_nums))
+            .distinct())
+    async with _async_session() as session:
+        users_id = await session.scalars(stmt)
+        return set(users_id.all())
+
+
+@connect
+async def apply_sub_diff(_async_session: async_sessionmaker[AsyncSession],
+                         user_id: int,
+                         bot_id: int,
+                         added: Sequence[tuple[str, int]],
+                         removed: Sequence[tuple[str, int]]
+                         ) -> tuple[tuple[str, int]]:
+    async with _async_session() as session:
+        async with session.begin():
+            if added:
+                await session.execute(
+                    insert(Sub)
+                    .values([{"user_id": user_id, "seq_num": seq_num, "bot_id": bot_id, "site": site}
+                             for site, seq_num in added])
+                    .on_conflict_do_nothing()
+                )
+            if removed:
+                await session.execute(
+                    delete(Sub)
+                    .where(Sub.user_id == user_id)
+                    .where(Sub.bot_id == bot_id)
+                    .where(tuple_(Sub.site, Sub.seq_num).in_(removed))
+                )
+            subs = await session.execute(
+                select(Sub.site, Sub.seq_num)
+                .where(Sub.user_id == user_id)
+                .where(Sub.bot_id == bot_id)
+                .order_by(Sub.site, Sub.seq_num)
+            )
+            subs = tuple(tuple(sub) for sub in subs.all())
+    logger.info(f"Apply subs of a user with id {user_id}: {subs}")
+    return subs
+
+
+@connect
+async def get_all_subs(_async_session: async_sessionmaker[AsyncSession]
+                       ) -> tuple[tuple[int, int, int, str]]:
+    stmt = select(Sub.user_id, Sub.seq_num, Sub.bot_id, Sub.site)
+    async with _async_session() as session:
+        result = await session.execute(stmt)
+        return tuple(tuple(row) for row in result.all())
+
+
 @connect
 async def remove_subs(_async_session: async_sessionmaker[AsyncSession],
                       user_id: int
@@ -214,3 +434,145 @@ async def update_bot_id(_async_session: async_sessionmaker[AsyncSession],
         await session.execute(stmt)
         await session.commit()
         logger.info(f"User {user_id} change new Bot {bot_id}")
+    _update_profile(user_id, bot_id=bot_id)
+
+
+@connect
+async def enqueue_notifications(_async_session: async_sessionmaker[AsyncSession],
+                                bot_id: int,
+                                site: str,
+                                version: str,
+                                message: dict[str: str],
+                                users_id: Sequence[int]
+                                ) -> int:
+    async with _async_session() as session:
+        async with session.begin():
+            await session.execute(
+                insert(NotificationMessage)
+                .values(site=site, version=version, message=message)
+                .on_conflict_do_nothing()
+            )
+            superseded = inserted = 0
+            for start in range(0, len(users_id), _ENQUEUE_CHUNK):
+                chunk = users_id[start:start + _ENQUEUE_CHUNK]
+                result = await session.execute(
+                    update(Notification)
+                    .where(Notification.bot_id == bot_id)
+                    .where(Notification.site == site)
+                    .where(Notification.state == "pending")
+                    .where(Notification.version != version)
+                    .where(Notification.user_id.in_(chunk))
+                    .values(state="superseded")
+                )
+                superseded += result.rowcount
+                result = await session.execute(
+                    insert(Notification)
+                    .values([{"bot_id": bot_id, "user_id": user_id, "site": site, "version": version}
+                             for user_id in chunk])
+                    .on_conflict_do_nothing()
+                )
+                inserted += result.rowcount
+    logger.info(f"Enqueue {inserted} notifications of site {site}, version {version}, "
+                f"superseded {superseded}")
+    return inserted
+
+
+@connect
+async def claim_notifications(_async_session: async_sessionmaker[AsyncSession],
+                              bot_id: int,
+                              limit: int,
+                              lease: float,
+                              max_attempts: int
+                              ) -> list[NotificationJob]:
+    claimed = (select(Notification.id)
+               .where(Notification.bot_id == bot_id)
+               .where(Notification.state == "pending")
+               .where(Notification.attempts < max_attempts)
+               .where(or_(Notification.lease_until.is_(None), Notification.lease_until < func.now()))
+               .order_by(Notification.id)
+               .limit(limit)
+               .with_for_update(skip_locked=True)
+               .cte("claimed"))
+    stmt = (update(Notification)
+            .where(Notification.id == claimed.c.id)
+            .values(lease_until=func.now() + timedelta(seconds=lease),
+                    attempts=Notification.attempts + 1)
+            .returning(Notification.id, Notification.user_id, Notification.site, Notification.version))
+    async with _async_session() as session:
+        async with session.begin():
+            dead = await session.execute(
+                update(Notification)
+                .where(Notification.bot_id == bot_id)
+                .where(Notification.state == "pending")
+                .where(Notification.attempts >= max_attempts)
+                .where(or_(Notification.lease_until.is_(None), Notification.lease_until < func.now()))
+                .values(state="dead", lease_until=None)
+            )
+            if dead.rowcount:
+                logger.warning(f"{dead.rowcount} notifications are dead after {max_attempts} attempts")
+            result = await session.execute(stmt)
+            return sorted(NotificationJob(*row) for row in result.all())
+
+
+@connect
+async def renew_notifications(_async_session: async_sessionmaker[AsyncSession],
+                              ids: Sequence[int],
+                              lease: float
+                              ) -> None:
+    async with _async_session() as session:
+        async with session.begin():
+            await session.execute(
+                update(Notification)
+                .where(Notification.id.in_(ids))
+                .where(Notification.state == "pending")
+                .values(lease_until=func.now() + timedelta(seconds=lease))
+            )
+
+
+@connect
+async def get_notification_messages(_async_session: async_sessionmaker[AsyncSession],
+                                    keys: Sequence[tuple[str, str]]
+                                    ) -> dict[tuple[str, str]: dict[str: str]]:
+    stmt = (select(NotificationMessage.site, NotificationMessage.version, NotificationMessage.message)
+            .where(tuple_(NotificationMessage.site, NotificationMessage.version).in_(keys)))
+    async with _async_session() as session:
+        result = await session.execute(stmt)
+        return {(site, version): message for site, version, message in result.all()}
+
+
+@connect
+async def ack_notifications(_async_session: async_sessionmaker[AsyncSession],
+                            states: dict[str: Sequence[int]]
+                            ) -> None:
+    async with _async_session() as session:
+        async with session.begin():
+            for state, ids in states.items():
+                if ids:
+                    await session.execute(
+                        update(Notification)
+                        .where(Notification.id.in_(ids))
+                        .values(state="pending" if state == "retry" else state, lease_until=None)
+                    )
+
+
+@connect
+async def purge_notifications(_async_session: async_sessionmaker[AsyncSession],
+                              retention: float
+                              ) -> int:
+    expired = func.now() - timedelta(seconds=retention)
+    async with _async_session() as session:
+        async with session.begin():
+            result = await session.execute(
+                delete(Notification)
+                .where(Notification.created_at < expired)
+            )
+            await session.execute(
+                delete(NotificationMessage)
+                .where(NotificationMessage.created_at < expired)
+                .where(~select(Notification.id)
+                       .where(Notification.site == NotificationMessage.site)
+                       .where(Notification.version == NotificationMessage.version)
+                       .exists())
+            )
+    logger.info(f"Purge {result.rowcount} notifications")
+    return result.rowcount
@@ -3,8 +3,12 @@ from typing import Sequence
 
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
-from database import Machine
+from catalog import Catalog
+from config import CATALOG_VERSIONS, KEYBOARD_CACHE_SIZE, SITES
+from lru import LRUCache
+from metrics import registry
 from text import TRANSLATE
+from webparser import MachineInfo
 
 logger = logging.getLogger(__name__)
 
@@ -69,47 +73,100 @@ menu_delete = {
 }
 
 
-async def menu_sub(machines: Sequence[Machine], subs: list[int]) -> dict[str, InlineKeyboardMarkup]:
-    menu = {
-        "ru": None,
-        "en": None
-    }
-    inline_keyboard = {
-        "ru": [],
-        "en": []
-    }
-    for lang in menu.keys():
-        for machine in machines:
-            if lang != "ru":
-                try:
-                    trans_type = TRANSLATE[lang][machine.type]
-                except KeyError:
-                    trans_type = machine.type
-                    logger.warning(f"None translate tor type {trans_type}")
-                inline_keyboard[lang] += [[
-                    InlineKeyboardButton(text=f"{'➤ ' if machine.seq_num in subs else ''} "
-                                              f"{trans_type} {machine.seq_num}",
-                                         callback_data=f"m{machine.seq_num}")
-                ]]
-            else:
-                inline_keyboard[lang] += [[
-                    InlineKeyboardButton(text=f"{'➤ ' if machine.seq_num in subs else ''} "
-                                              f"{machine.type} {machine.seq_num}",
-                                         callback_data=f"m{machine.seq_num}")
-                ]]
-    inline_keyboard["ru"] += [
+_menu_sub_footer = {
+    "ru": [
         [InlineKeyboardButton(text="🔔 Подписаться", callback_data="sub")],
         [InlineKeyboardButton(text="🔕 Отписаться", callback_data="unsub")],
-        [InlineKeyboardButton(text="🗑️ Удалить", callback_data="delete")
-    ]
-                              ]
-    inline_keyboard["en"] += [
+        [InlineKeyboardButton(text="🗑️ Удалить", callback_data="delete")]
+    ],
+    "en": [
         [InlineKeyboardButton(text="🔔 Subscribe", callback_data="sub")],
         [InlineKeyboardButton(text="🔕 Unsubscribe", callback_data="unsub")],
         [InlineKeyboardButton(text="🗑️ Delete", callback_data="delete")]
     ]
+}
+
+_Menu = dict[str, InlineKeyboardMarkup]
+
+
+def _machine_type(machine: MachineInfo, lang: str) -> str:
+    if lang == "ru":
+        return machine.type
+    try:
+        return TRANSLATE[lang][machine.type]
+    except KeyError:
+        logger.warning(f"None translate tor type {machine.type}")
+        return machine.type
+
+
+class SubKeyboard:
+    def __init__(self, catalog: Catalog) -> None:
+        self.catalog = catalog
+        self._rows: dict[tuple[str, int, int], list[InlineKeyboardButton]] = {}
+
+    def _row(self, lang: str, pos: int, selected: int) -> list[InlineKeyboardButton]:
+        key = (lang, pos, selected)
+        row = self._rows.get(key)
+        if row is None:
+            machine = self.catalog.machines[pos]
+            site = f"{machine.site} · " if len(SITES) > 1 else ""
+            mark = "➤  " if selected else " "
+            row = [InlineKeyboardButton(
+                text=f"{mark}{site}{_machine_type(machine, lang)} {machine.seq_num}",
+                callback_data=f"m{machine.site}:{machine.seq_num}"
+            )]
+            self._rows[key] = row
+        return row
+
+    def build(self, mask: int) -> _Menu:
+        positions = range(len(self.catalog.machines))
+        return {
+            lang: InlineKeyboardMarkup.model_construct(
+                inline_keyboard=[self._row(lang, pos, mask >> pos & 1) for pos in positions] + footer
+            )
+            for lang, footer in _menu_sub_footer.items()
+        }
+
+    def markup(self, mask: int) -> _Menu:
+        key = (self.catalog.version, mask)
+        menu = _markups.get(key)
+        if menu is None:
+            menu = self.build(mask)
+            _markups.set(key, menu)
+        return menu
+
+    def toggle(self, mask: int, site: str, seq_num: int) -> tuple[int, _Menu]:
+        pos = self.catalog.positions[(site, seq_num)]
+        new_mask = mask ^ 1 << pos
+        key = (self.catalog.version, new_mask)
+        menu = _markups.get(key)
+        if menu is not None:
+            return new_mask, menu
+        old_menu = _markups.get((self.catalog.version, mask))
+        if old_menu is None:
+            return new_mask, self.markup(new_mask)
+        menu = {}
+        for lang, markup in old_menu.items():
+            inline_keyboard = list(markup.inline_keyboard)
+            inline_keyboard[pos] = self._row(lang, pos, new_mask >> pos & 1)
+            menu[lang] = InlineKeyboardMarkup.model_construct(inline_keyboard=inline_keyboard)
+        _markups.set(key, menu)
+        return new_mask, menu
+
+
+_keyboards = LRUCache(maxsize=CATALOG_VERSIONS)
+_markups = LRUCache(maxsize=KEYBOARD_CACHE_SIZE)
+registry.track_cache("sub_keyboard", _markups)
+
+
+def sub_keyboard(catalog: Catalog) -> SubKeyboard:
+    kb = _keyboards.get(catalog.version)
+    if kb is None:
+        kb = SubKeyboard(catalog)
+        _keyboards.set(catalog.version, kb)
+    return kb
 
-    menu["ru"] = InlineKeyboardMarkup(inline_keyboard=inline_keyboard["ru"])
-    menu["en"] = InlineKeyboardMarkup(inline_keyboard=inline_keyboard["en"])
 
-    return menu
+async def menu_sub(machines: Sequence[MachineInfo], subs: list[tuple[str, int]]) -> _Menu:
+    catalog = Catalog(machines)
+    return SubKeyboard(catalog).build(catalog.to_mask(subs))
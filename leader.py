@@ -0,0 +1,139 @@
+import asyncio
+import fcntl
+import logging
+import os
+from typing import Awaitable, Callable, Protocol
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+import config
+import database
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock(Protocol):
+    async def acquire(self) -> bool: ...
+
+    async def check(self) -> bool: ...
+
+    async def release(self) -> None: ...
+
+
+class PgAdvisoryLock:
+    def __init__(self, key: int) -> None:
+        self.key = key
+        self._conn: AsyncConnection | None = None
+
+    async def acquire(self) -> bool:
+        try:
+            conn = await database.get_engine().connect()
+        except OSError:
+            logger.error("No connection to database")
+            return False
+        try:
+            locked = await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key})
+        except Exception:
+            await conn.close()
+            raise
+        if not locked:
+            await conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    async def check(self) -> bool:
+        try:
+            await self._conn.scalar(text("SELECT 1"))
+            return True
+        except Exception:
+            logger.error("Connection holding the leader lock is lost", exc_info=True)
+            return False
+
+    async def release(self) -> None:
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        try:
+            await conn.scalar(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+        except Exception:
+            logger.debug("Leader lock is released with its connection")
+        finally:
+            await conn.close()
+
+
+class FileLock:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._fd: int | None = None
+
+    async def acquire(self) -> bool:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    async def check(self) -> bool:
+        return self._fd is not None
+
+    async def release(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+def check_config() -> None:
+    if config.LEADER_ELECTION != "off" and not config.CACHE_SHARED:
+        raise ValueError("Leader election needs a shared cache, set CACHE_URL to a redis:// or disk:// backend")
+
+
+def create_lock() -> LeaderLock:
+    check_config()
+    if config.LEADER_ELECTION == "postgres":
+        return PgAdvisoryLock(config.LEADER_LOCK_KEY)
+    if config.LEADER_ELECTION == "file":
+        return FileLock(config.LEADER_LOCK_PATH)
+    raise ValueError(f"Unknown leader election mode {config.LEADER_ELECTION}")
+
+
+async def _check(lock: LeaderLock) -> bool:
+    try:
+        return await lock.check()
+    except Exception:
+        logger.exception("Leader lock check failed")
+        return False
+
+
+async def run_as_leader(lock: LeaderLock,
+                        jobs: list[Callable[[], Awaitable]],
+                        retry_interval: float = config.LEADER_RETRY_INTERVAL,
+                        check_interval: float = config.LEADER_CHECK_INTERVAL
+                        ) -> None:
+    while True:
+        try:
+            acquired = await lock.acquire()
+        except Exception:
+            logger.exception("Leader lock has not been acquired")
+            acquired = False
+        if acquired:
+            logger.info("This replica is the leader, start polling")
+            tasks = [asyncio.create_task(job()) for job in jobs]
+            try:
+                while await _check(lock):
+                    await asyncio.sleep(check_interval)
+                logger.warning("Leadership is lost, stop polling")
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                try:
+                    await lock.release()
+                except Exception:
+                    logger.exception("Leader lock has not been released")
+        await asyncio.sleep(retry_interval)
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError, TelegramRetryAfter
+from cashews import Cache
+
+import config
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+messages = registry.counter("washbot_messages_total", "Mailing messages by result", ["result"])
+retry_after = registry.counter("washbot_retry_after_total", "Telegram flood control responses")
+send_seconds = registry.histogram("washbot_send_seconds", "Telegram sendMessage latency")
+mailing_seconds = registry.histogram("washbot_mailing_seconds", "Mailing duration",
+                                     buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class SharedRateLimiter:
+    def __init__(self, cache: Cache, rate: int, key: str = "mailing:rate") -> None:
+        self.cache = cache
+        self.rate = rate
+        self.key = key
+
+    async def pause(self, seconds: float) -> None:
+        await self.cache.set(f"{self.key}:pause", time.time() + seconds, expire=seconds + 1)
+
+    async def acquire(self) -> None:
+        while True:
+            paused_until = await self.cache.get(f"{self.key}:pause")
+            now = time.time()
+            if paused_until is not None and now < paused_until:
+                await asyncio.sleep(paused_until - now)
+                continue
+            window = int(now)
+            if await self.cache.incr(f"{self.key}:{window}", expire=2) <= self.rate:
+                return
+            await asyncio.sleep(window + 1 - now)
+
+
+class ChatLimiter:
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._next_time: dict[int, float] = {}
+
+    async def wait(self, chat_id: int) -> None:
+        now = time.monotonic()
+        next_time = self._next_time.get(chat_id, now)
+        self._next_time[chat_id] = max(now, next_time) + self.interval
+        if next_time > now:
+            await asyncio.sleep(next_time - now)
+
+    def prune(self) -> None:
+        now = time.monotonic()
+        self._next_time = {chat_id: next_time for chat_id, next_time in self._next_time.items()
+                           if next_time > now}
+
+
+@dataclass
+class MailingResult:
+    delivered: int = 0
+    failed: int = 0
+    blocked: int = 0
+    retry_after: int = 0
+    blocked_users: list[int] = field(default_factory=list)
+    delivered_users: list[int] = field(default_factory=list)
+    failed_users: list[int] = field(default_factory=list)
+
+
+if config.CACHE_SHARED:
+    from service import cache
+    global_limiter = SharedRateLimiter(cache, rate=config.MAILING_RATE)
+else:
+    global_limiter = TokenBucket(rate=config.MAILING_RATE, capacity=config.MAILING_RATE)
+chat_limiter = ChatLimiter(interval=config.MAILING_CHAT_INTERVAL)
+
+
+async def _send(bot: Bot,
+                user_id: int,
+                text: str,
+                reply_markup,
+                result: MailingResult
+                ) -> None:
+    for _ in range(config.MAILING_RETRIES):
+        await global_limiter.acquire()
+        await chat_limiter.wait(user_id)
+        try:
+            with send_seconds.time():
+                await bot.send_message(chat_id=user_id,
+                                       text=text,
+                                       reply_markup=reply_markup)
+            result.delivered += 1
+            result.delivered_users.append(user_id)
+            messages.inc(result="delivered")
+            return
+        except TelegramRetryAfter as exc:
+            logger.warning(f"Flood control, retry after {exc.retry_after} seconds")
+            result.retry_after += 1
+            retry_after.inc()
+            await global_limiter.pause(exc.retry_after)
+        except TelegramForbiddenError:
+            logger.error("User blocked bot")
+            result.blocked += 1
+            result.blocked_users.append(user_id)
+            messages.inc(result="blocked")
+            return
+        except TelegramAPIError:
+            logger.error(f"Message to user {user_id} has not been sent", exc_info=True)
+            break
+    result.failed += 1
+    result.failed_users.append(user_id)
+    messages.inc(result="failed")
+
+
+async def broadcast(bot: Bot,
+                    users_id: Iterable[int],
+                    langs: dict[int: str],
+                    message: dict[str: str],
+                    reply_markup: dict[str: str]
+                    ) -> MailingResult:
+    result = MailingResult()
+    queue = asyncio.Queue()
+    for user_id in users_id:
+        queue.put_nowait(user_id)
+
+    async def worker() -> None:
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            lang = langs.get(user_id) or config.DEFAULT_LANG
+            await _send(bot, user_id, message[lang], reply_markup[lang], result)
+
+    workers = min(config.MAILING_WORKERS, queue.qsize())
+    with mailing_seconds.time():
+        await asyncio.gather(*(worker() for _ in range(workers)))
+    chat_limiter.prune()
+    return result
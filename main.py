@@ -4,30 +4,70 @@ import asyncio
 
 from aiogram import Dispatcher
 
+import admin_handlers
+import config
+import database
+import leader
+import metrics
+import middlewares
+import migrations
+import outbox
 import script
 import user_handlers
-from service import bot
+import webparser
+import webhook
+from service import bot, create_fsm_storage, get_http_session, close_http_session
 
 
 async def startup():
-    asyncio.create_task(script.update_data())
+    asyncio.create_task(outbox.run_workers())
+    if config.LEADER_ELECTION == "off":
+        asyncio.create_task(script.update_data())
+        asyncio.create_task(script.refresh_catalog())
+        asyncio.create_task(outbox.purge())
+    else:
+        asyncio.create_task(leader.run_as_leader(
+            lock=leader.create_lock(),
+            jobs=[script.update_data, script.refresh_catalog, outbox.purge]
+        ))
 
 
 async def main():
     logger = logging.getLogger(__name__)
-    await script.check_bot()
-    await script.check_machines()
-    dp = Dispatcher()
-    dp.include_routers(user_handlers.router_private)
+    leader.check_config()
+    webhook.check_config()
+    await migrations.migrate()
+    get_http_session()
+    bot_checked = asyncio.ensure_future(script.check_bot())
+    await asyncio.gather(bot_checked, script.check_machines(bot_checked))
+    await script.load_subscriptions()
+    dp = Dispatcher(storage=create_fsm_storage())
+    dp.update.outer_middleware(middlewares.UpdateLatencyMiddleware())
+    for router in (admin_handlers.router_admin, user_handlers.router_private):
+        router.message.middleware(middlewares.HandlerLatencyMiddleware())
+        router.callback_query.middleware(middlewares.HandlerLatencyMiddleware())
+    dp.include_routers(admin_handlers.router_admin, user_handlers.router_private)
     dp.startup.register(startup)
+    metrics_runner = None
+    if config.METRICS_PORT:
+        metrics_runner = await metrics.start_server(config.METRICS_HOST, config.METRICS_PORT)
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(
-            bot,
-            allowed_updates=dp.resolve_used_update_types(),
-        )
+        if config.WEBHOOK_URL:
+            await webhook.run(dp, bot)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(
+                bot,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
     finally:
+        await dp.storage.close()
         await bot.session.close()
+        await close_http_session()
+        webparser.parser.shutdown()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await database.dispose()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,214 @@
+import logging
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Sequence
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+_Labels = tuple[str, ...]
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelnames: Sequence[str] = (),
+                 func: Callable[[], float | dict[_Labels, float]] | None = None
+                 ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.func = func
+        self._values: dict[_Labels, float] = {}
+
+    def _key(self, labels: dict[str: str]) -> _Labels:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def get(self, **labels) -> float:
+        return self._collect().get(self._key(labels), 0.0)
+
+    def _collect(self) -> dict[_Labels, float]:
+        if self.func is None:
+            return self._values
+        values = self.func()
+        return values if isinstance(values, dict) else {(): values}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for key, value in sorted(self._collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS
+                 ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: dict[_Labels, list[int]] = {}
+        self._sums: dict[_Labels, float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * len(self.buckets)
+            self._sums[key] = 0.0
+        for pos, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[pos] += 1
+                break
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def sum(self, **labels) -> float:
+        return self._sums.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for key, counts in sorted(self._counts.items()):
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {total}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(self._sums[key])}")
+            lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+        self._caches: dict[str, object] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (), func=None) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, func))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), func=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, func))
+
+    def histogram(self,
+                  name: str,
+                  documentation: str,
+                  labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS
+                  ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def track_cache(self, name: str, cache: object) -> None:
+        self._caches[name] = cache
+
+    def cache_stats(self, attr: str) -> dict[_Labels, float]:
+        return {(name,): getattr(cache, attr) for name, cache in self._caches.items()}
+
+    def cache_ratios(self) -> dict[_Labels, float]:
+        ratios = {}
+        for name, cache in self._caches.items():
+            total = cache.hits + cache.misses
+            ratios[(name,)] = cache.hits / total if total else 0.0
+        return ratios
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+registry.counter("washbot_cache_hits_total", "Cache hits", ["cache"],
+                 func=lambda: registry.cache_stats("hits"))
+registry.counter("washbot_cache_misses_total", "Cache misses", ["cache"],
+                 func=lambda: registry.cache_stats("misses"))
+registry.gauge("washbot_cache_hit_ratio", "Cache hit ratio since start", ["cache"],
+               func=registry.cache_ratios)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(create_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info(f"Metrics server is started on {host}:{port}")
+    return runner
@@ -0,0 +1,49 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.types import TelegramObject, Update
+
+import config
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+update_seconds = registry.histogram("washbot_update_seconds", "Update processing latency", ["type", "handler"])
+handler_seconds = registry.histogram("washbot_handler_seconds", "Handler latency", ["handler"])
+slow_updates = registry.counter("washbot_slow_updates_total", "Updates slower than the threshold", ["type"])
+
+_Handler = Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]]
+
+
+class UpdateLatencyMiddleware(BaseMiddleware):
+    def __init__(self, threshold: float = config.SLOW_UPDATE_THRESHOLD) -> None:
+        self.threshold = threshold
+
+    async def __call__(self, handler: _Handler, event: Update, data: dict[str, Any]) -> Any:
+        timing = data["timing"] = {"handler": "unhandled"}
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            latency = time.perf_counter() - start
+            update_seconds.observe(latency, type=event.event_type, handler=timing["handler"])
+            if latency > self.threshold:
+                slow_updates.inc(type=event.event_type)
+                logger.warning(f"Slow update {event.update_id}: {event.event_type} "
+                               f"handled by {timing['handler']} in {latency * 1000:.0f} ms")
+
+
+class HandlerLatencyMiddleware(BaseMiddleware):
+    async def __call__(self, handler: _Handler, event: TelegramObject, data: dict[str, Any]) -> Any:
+        handler_object: HandlerObject | None = data.get("handler")
+        name = getattr(handler_object.callback, "__name__", "unknown") if handler_object else "unknown"
+        timing = data.get("timing")
+        if timing is not None:
+            timing["handler"] = name
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_seconds.observe(time.perf_counter() - start, handler=name)
@@ -0,0 +1,103 @@
+import logging
+from typing import Awaitable, Callable, NamedTuple
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+import config
+import database
+from database import Base, Notification, NotificationMessage, SchemaVersion, Sub, User
+
+logger = logging.getLogger(__name__)
+
+_LOCK_KEY = 0x57415348
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    upgrade: Callable[[AsyncConnection], Awaitable[None]]
+
+
+async def _baseline(conn: AsyncConnection) -> None:
+    await conn.run_sync(Base.metadata.create_all)
+
+
+_UPGRADE_SITES = (
+    'ALTER TABLE "Sub" DROP CONSTRAINT IF EXISTS "Sub_seq_num_bot_id_fkey"',
+    'ALTER TABLE "Machine" ADD COLUMN site VARCHAR NOT NULL DEFAULT :site',
+    'ALTER TABLE "Machine" ALTER COLUMN site DROP DEFAULT',
+    'ALTER TABLE "Machine" DROP CONSTRAINT "Machine_pkey", '
+    'ADD CONSTRAINT "Machine_pkey" PRIMARY KEY (seq_num, bot_id, site)',
+    'ALTER TABLE "Sub" ADD COLUMN site VARCHAR NOT NULL DEFAULT :site',
+    'ALTER TABLE "Sub" ALTER COLUMN site DROP DEFAULT',
+    'ALTER TABLE "Sub" DROP CONSTRAINT "Sub_pkey", '
+    'ADD CONSTRAINT "Sub_pkey" PRIMARY KEY (user_id, seq_num, bot_id, site)',
+    'ALTER TABLE "Sub" ADD CONSTRAINT "Sub_seq_num_bot_id_site_fkey" '
+    'FOREIGN KEY (seq_num, bot_id, site) REFERENCES "Machine" (seq_num, bot_id, site)'
+)
+
+
+async def _sites(conn: AsyncConnection) -> None:
+    has_site = await conn.scalar(text(
+        "SELECT count(*) FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = 'Machine' AND column_name = 'site'"
+    ))
+    if has_site:
+        return
+    site = config.DEFAULT_SITE.replace("'", "''")
+    for stmt in _UPGRADE_SITES:
+        await conn.execute(text(stmt.replace(":site", f"'{site}'")))
+    logger.info(f"Upgrade Machine and Sub tables to sites, existing rows belong to site {config.DEFAULT_SITE}")
+
+
+async def _indexes(conn: AsyncConnection) -> None:
+    for table in (User.__table__, Sub.__table__):
+        for index in table.indexes:
+            await conn.run_sync(index.create, checkfirst=True)
+    await conn.execute(text('ANALYZE "User"'))
+    await conn.execute(text('ANALYZE "Sub"'))
+
+
+async def _outbox(conn: AsyncConnection) -> None:
+    for table in (NotificationMessage.__table__, Notification.__table__):
+        await conn.run_sync(table.create, checkfirst=True)
+
+
+async def _drop_user_profile(conn: AsyncConnection) -> None:
+    await conn.execute(text('DROP INDEX IF EXISTS "ix_User_profile"'))
+
+
+async def _drop_user_bot_id(conn: AsyncConnection) -> None:
+    await conn.execute(text('DROP INDEX IF EXISTS "ix_User_bot_id"'))
+
+
+MIGRATIONS = (
+    Migration(1, "baseline", _baseline),
+    Migration(2, "sites", _sites),
+    Migration(3, "indexes", _indexes),
+    Migration(4, "outbox", _outbox),
+    Migration(5, "drop_user_profile", _drop_user_profile),
+    Migration(6, "drop_user_bot_id", _drop_user_bot_id),
+)
+
+
+async def migrate(engine: AsyncEngine | None = None) -> int:
+    engine = engine or database.get_engine()
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _LOCK_KEY})
+            await conn.run_sync(SchemaVersion.__table__.create, checkfirst=True)
+            applied = set(await conn.scalars(select(SchemaVersion.version)))
+            pending = [migration for migration in MIGRATIONS if migration.version not in applied]
+            for migration in pending:
+                await migration.upgrade(conn)
+                await conn.execute(SchemaVersion.__table__.insert().values(version=migration.version,
+                                                                           name=migration.name))
+                logger.info(f"Apply migration {migration.version}: {migration.name}")
+    except OSError as exc:
+        logger.error("No connection to database")
+        raise ConnectionError("No connection to database") from exc
+    if not pending:
+        logger.debug("Schema is up to date")
+    return len(pending)
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from typing import Sequence
+
+import config
+import database
+import keyboard
+import mailer
+import subscriptions
+from database import NotificationJob, User
+from lru import LRUCache
+from metrics import registry
+from service import bot
+
+logger = logging.getLogger(__name__)
+claimed = registry.counter("washbot_outbox_claimed_total", "Notifications claimed from the outbox")
+acked = registry.counter("washbot_outbox_acked_total", "Notifications acknowledged by state", ["state"])
+_messages = LRUCache(maxsize=64)
+_wakeup = asyncio.Event()
+
+
+def notify() -> None:
+    _wakeup.set()
+
+
+async def enqueue(site: str, version: str, message: dict[str: str], users_id: Sequence[int]) -> int:
+    count = await database.enqueue_notifications(bot.id, site, version, message, users_id)
+    _messages.set((site, version), message)
+    notify()
+    return count
+
+
+async def remove_blocked_users(users_id: Sequence[int]) -> None:
+    for user_id in users_id:
+        try:
+            await database.remove_by_id(obj_type=User, obj_id=user_id)
+            subscriptions.index.remove_user(user_id)
+        except ConnectionError:
+            pass
+
+
+async def _get_messages(keys: Sequence[tuple[str, str]]) -> dict[tuple[str, str]: dict[str: str]]:
+    messages = {}
+    missing = []
+    for key in keys:
+        message = _messages.get(key)
+        if message is None:
+            missing.append(key)
+        else:
+            messages[key] = message
+    if missing:
+        for key, message in (await database.get_notification_messages(missing)).items():
+            _messages.set(key, message)
+            messages[key] = message
+    return messages
+
+
+async def _renew_lease(jobs_id: Sequence[int]) -> None:
+    while True:
+        await asyncio.sleep(config.OUTBOX_LEASE / 3)
+        try:
+            await database.renew_notifications(jobs_id, config.OUTBOX_LEASE)
+        except ConnectionError:
+            pass
+
+
+async def deliver_batch() -> int:
+    jobs: list[NotificationJob] = await database.claim_notifications(
+        bot.id, config.OUTBOX_BATCH, config.OUTBOX_LEASE, config.OUTBOX_MAX_ATTEMPTS
+    )
+    if not jobs:
+        return 0
+    claimed.inc(len(jobs))
+    renewal = asyncio.create_task(_renew_lease([job.id for job in jobs]))
+    try:
+        states, blocked_users = await _deliver(jobs)
+    finally:
+        renewal.cancel()
+    await database.ack_notifications(states)
+    for state, jobs_id in states.items():
+        acked.inc(len(jobs_id), state=state)
+    logger.info(f"Outbox batch is delivered: sent {len(states['sent'])}, retry {len(states['retry'])}, "
+                f"failed {len(states['failed'])}, blocked {len(states['blocked'])}")
+    await remove_blocked_users(blocked_users)
+    return len(jobs)
+
+
+async def _deliver(jobs: Sequence[NotificationJob]) -> tuple[dict[str: list[int]], list[int]]:
+    groups: dict[tuple[str, str]: dict[int: int]] = {}
+    for job in jobs:
+        groups.setdefault((job.site, job.version), {})[job.user_id] = job.id
+    messages = await _get_messages(list(groups))
+    try:
+        langs = await database.get_users_lang([job.user_id for job in jobs])
+    except ConnectionError:
+        langs = {}
+    states = {"sent": [], "retry": [], "failed": [], "blocked": []}
+    blocked_users = []
+    for key, jobs_id in groups.items():
+        message = messages.get(key)
+        if message is None:
+            logger.error(f"Notification message of site {key[0]}, version {key[1]} has not been found")
+            states["failed"].extend(jobs_id.values())
+            continue
+        result = await mailer.broadcast(
+            bot=bot,
+            users_id=jobs_id.keys(),
+            langs=langs,
+            message=message,
+            reply_markup=keyboard.menu_update
+        )
+        states["sent"].extend(jobs_id[user_id] for user_id in result.delivered_users)
+        states["retry"].extend(jobs_id[user_id] for user_id in result.failed_users)
+        states["blocked"].extend(jobs_id[user_id] for user_id in result.blocked_users)
+        blocked_users.extend(result.blocked_users)
+    return states, blocked_users
+
+
+async def _worker() -> None:
+    while True:
+        try:
+            if await deliver_batch():
+                continue
+        except ConnectionError:
+            pass
+        except Exception:
+            logger.exception("Outbox delivery failed")
+        try:
+            await asyncio.wait_for(_wakeup.wait(), config.OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+
+
+async def run_workers() -> None:
+    await asyncio.gather(*(_worker() for _ in range(config.OUTBOX_WORKERS)))
+
+
+async def purge() -> None:
+    while True:
+        try:
+            await database.purge_notifications(config.OUTBOX_RETENTION)
+        except ConnectionError:
+            pass
+        except Exception:
+            logger.exception("Outbox purge failed")
+        await asyncio.sleep(config.OUTBOX_PURGE_INTERVAL)
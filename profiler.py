@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+
+import config
+
+logger = logging.getLogger("scalene")
+
+
+def _collapse(frame: FrameType | None) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":"))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.running = False
+
+    def _sample(self, thread_id: int, stacks: Counter, stop: threading.Event) -> None:
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                stacks[_collapse(frame)] += 1
+
+    async def profile(self, seconds: float, path: str) -> int:
+        if self.running:
+            raise RuntimeError("Profiling is already running")
+        self.running = True
+        stacks = Counter()
+        stop = threading.Event()
+        thread = threading.Thread(target=self._sample, args=(threading.get_ident(), stacks, stop),
+                                  name="profiler", daemon=True)
+        logger.info(f"Start profiling the event loop for {seconds} seconds")
+        try:
+            thread.start()
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.to_thread(thread.join)
+            self.running = False
+        await asyncio.to_thread(self._dump, stacks, path)
+        samples = sum(stacks.values())
+        logger.info(f"Profile is saved to {path}: {samples} samples, {len(stacks)} stacks")
+        return samples
+
+    @staticmethod
+    def _dump(stacks: Counter, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf8") as file:
+            for stack, count in stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+def profile_path() -> str:
+    return os.path.join(config.PROFILE_DIR, time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+
+
+profiler = SamplingProfiler(interval=config.PROFILE_INTERVAL)
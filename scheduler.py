@@ -0,0 +1,49 @@
+import logging
+import random
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PollScheduler:
+    def __init__(self,
+                 interval: float,
+                 min_interval: float,
+                 max_interval: float,
+                 backoff_max: float,
+                 boost_cycles: int = 3,
+                 window: int = 20
+                 ) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_max = backoff_max
+        self.boost_cycles = boost_cycles
+        self.interval = min(max(interval, min_interval), max_interval)
+        self.failures = 0
+        self._boost = 0
+        self._changes: deque[bool] = deque(maxlen=window)
+
+    @property
+    def change_rate(self) -> float:
+        if not self._changes:
+            return 0.0
+        return sum(self._changes) / len(self._changes)
+
+    def on_success(self, changed: bool) -> float:
+        self.failures = 0
+        self._changes.append(changed)
+        if changed:
+            self._boost = self.boost_cycles
+        if self._boost:
+            self._boost -= 1
+            self.interval = self.min_interval
+        else:
+            self.interval = self.max_interval - (self.max_interval - self.min_interval) * self.change_rate
+        return self.interval
+
+    def on_error(self) -> float:
+        self.failures += 1
+        cap = min(self.backoff_max, self.interval * 2 ** self.failures)
+        delay = cap / 2 + random.uniform(0, cap / 2)
+        logger.warning(f"Poll failed {self.failures} times in a row, retry in {delay:.1f} seconds")
+        return delay
@@ -1,32 +1,107 @@
 import asyncio
 import logging
+import time
+from typing import Awaitable, Sequence
 
 from aiogram.types import Message
-from aiogram.exceptions import TelegramForbiddenError
 from aiohttp import ClientSession
 
+import catalog
 import config
 import database
 from database import User, Bot
 import webparser
-from service import bot
+import mailer
+import outbox
+import subscriptions
+import status_store
+from scheduler import PollScheduler
+from mailer import MailingResult
+from metrics import registry
+from service import bot, get_http_session
 import text
 import keyboard
 from config import LANGUAGES, DEFAULT_LANG
 
 
 logger = logging.getLogger(__name__)
-
-
-async def check_machines() -> None:
-    async with ClientSession() as session:
+_background_tasks: set[asyncio.Task] = set()
+poll_cycle_seconds = registry.histogram("washbot_poll_cycle_seconds", "Poll loop cycle duration", ["site"])
+poll_errors = registry.counter("washbot_poll_errors_total", "Failed poll loop cycles", ["site"])
+_synced_catalogs: dict[str: Sequence[webparser.MachineInfo]] = {}
+_site_semaphore = asyncio.Semaphore(config.SITE_CONCURRENCY)
+schedulers = {
+    site: PollScheduler(
+        interval=config.UPDATE_TIME,
+        min_interval=config.UPDATE_TIME_MIN,
+        max_interval=config.UPDATE_TIME_MAX,
+        backoff_max=config.UPDATE_BACKOFF_MAX,
+        boost_cycles=config.UPDATE_BOOST_CYCLES,
+        window=config.UPDATE_RATE_WINDOW
+    )
+    for site in config.SITES
+}
+registry.gauge("washbot_poll_interval_seconds", "Current poll interval", ["site"],
+               func=lambda: {(site,): scheduler.interval for site, scheduler in schedulers.items()})
+registry.gauge("washbot_poll_failures", "Consecutive failed polls", ["site"],
+               func=lambda: {(site,): scheduler.failures for site, scheduler in schedulers.items()})
+registry.gauge("washbot_poll_change_rate", "Share of recent polls that saw a change", ["site"],
+               func=lambda: {(site,): scheduler.change_rate for site, scheduler in schedulers.items()})
+
+
+async def check_machines(bot_checked: Awaitable | None = None) -> None:
+    async def check_site(site: str) -> None:
         try:
-            for machine in await webparser.get_machines(session):
-                machine.bot_id = bot.id
-                await database.add_object(machine)
+            snapshot = await webparser.get_snapshot(get_http_session(), site)
+            if bot_checked is not None:
+                await bot_checked
+            await sync_catalog(site, snapshot.machines)
         except ConnectionError:
             pass
 
+    await asyncio.gather(*(check_site(site) for site in config.SITES))
+
+
+async def sync_catalog(site: str, machines: Sequence[webparser.MachineInfo]) -> None:
+    if not machines or machines == _synced_catalogs.get(site):
+        return
+    await database.upsert_machines(bot.id, machines)
+    _synced_catalogs[site] = machines
+    catalog.invalidate()
+
+
+async def refresh_catalog() -> None:
+    while True:
+        await asyncio.sleep(config.CATALOG_REFRESH_TIME)
+        for site, store in status_store.stores.items():
+            if store.snapshot is None:
+                continue
+            try:
+                await sync_catalog(site, store.snapshot.machines)
+            except ConnectionError:
+                pass
+            except Exception:
+                logger.exception(f"Catalog of site {site} has not been refreshed")
+
+
+async def load_subscriptions() -> None:
+    try:
+        subscriptions.index.load(await database.get_all_subs())
+    except ConnectionError:
+        logger.error("Subscription index has not been loaded")
+
+
+async def get_recipients(site: str, seq_nums: set[int]) -> set[int]:
+    if not seq_nums:
+        return set()
+    if subscriptions.index.loaded and config.LEADER_ELECTION == "off":
+        return subscriptions.index.recipients(bot.id, site, seq_nums)
+    try:
+        return await database.get_recipients(bot.id, site, list(seq_nums))
+    except ConnectionError:
+        logger.error(f"Recipients of site {site} are taken from the local subscription index")
+        return subscriptions.index.recipients(bot.id, site, seq_nums)
+
 
 async def check_bot() -> None:
     if not await database.get_by_id(Bot, bot.id):
@@ -39,8 +114,8 @@ async def check_bot() -> None:
 
 
 async def check_user(message: Message) -> None:
-    user = await database.get_by_id(User, message.from_user.id)
-    if not user:
+    profile = await database.get_user_profile(message.from_user.id)
+    if not profile:
         user = User(
             id=message.from_user.id,
             bot_id=bot.id,
@@ -48,56 +123,105 @@ async def check_user(message: Message) -> None:
             lang=message.from_user.language_code if message.from_user.language_code in LANGUAGES else DEFAULT_LANG
         )
         await database.add_object(user)
-    elif user.bot_id != bot.id:
-        await database.remove_subs(user.id)
-        await database.update_bot_id(user.id, bot.id)
-
-
-async def mailing(users_id: list[int], message: dict[str: str], reply_markup: dict[str: str]) -> None:
-    for user_id in users_id:
-        lang = await database.get_user_lang(user_id)
+    elif profile.bot_id != bot.id:
+        await database.remove_subs(message.from_user.id)
+        subscriptions.index.remove_user(message.from_user.id)
+        await database.update_bot_id(message.from_user.id, bot.id)
+
+
+async def mailing(users_id: list[int], message: dict[str: str], reply_markup: dict[str: str]) -> MailingResult:
+    try:
+        langs = await database.get_users_lang(users_id)
+    except ConnectionError:
+        langs = {}
+    result = await mailer.broadcast(
+        bot=bot,
+        users_id=users_id,
+        langs=langs,
+        message=message,
+        reply_markup=reply_markup
+    )
+    logger.info(f"Mailing is finished: delivered {result.delivered}, "
+                f"failed {result.failed}, blocked {result.blocked}")
+    await outbox.remove_blocked_users(result.blocked_users)
+    return result
+
+
+def _run_in_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def _poll(poller: webparser.SitePoller, session: ClientSession) -> webparser.Snapshot:
+    async with _site_semaphore:
+        return await poller.poll(session)
+
+
+async def poll_site(site: str) -> None:
+    poller = webparser.SitePoller(site=site)
+    scheduler = schedulers[site]
+    store = status_store.stores[site]
+    session = get_http_session()
+    old_snapshot = None
+    while old_snapshot is None or not old_snapshot.machines:
         try:
-            await bot.send_message(chat_id=user_id,
-                                   text=message[lang],
-                                   reply_markup=reply_markup[lang])
-        except TelegramForbiddenError:
-            logger.error("User blocked bot")
-            await database.remove_by_id(
-                obj_type=User,
-                obj_id=(user_id, bot.seq_num)
-            )
-
-
-async def update_data() -> None:
-    async with ClientSession() as session:
-        old_status = None
-        while not old_status:
-            try:
-                old_status = await webparser.get_machines_status(session)
-            except ConnectionError:
-                await asyncio.sleep(config.UPDATE_TIME)
-        while True:
-            try:
-                status = await webparser.get_machines_status(session)
-                if status != old_status:
-                    logger.info("Status of machines is changed")
+            old_snapshot = await _poll(poller, session)
+            await store.publish(old_snapshot)
+            if not old_snapshot.machines:
+                logger.warning(f"No machines have been parsed, site {site}")
+                await asyncio.sleep(scheduler.on_error())
+        except ConnectionError:
+            poll_errors.inc(site=site)
+            await asyncio.sleep(scheduler.on_error())
+        except Exception:
+            logger.exception(f"Site {site} polling failed")
+            poll_errors.inc(site=site)
+            await asyncio.sleep(scheduler.on_error())
+    delay = scheduler.interval
+    while True:
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        try:
+            snapshot = await _poll(poller, session)
+            await store.publish(snapshot)
+            status, old_status = snapshot.status, old_snapshot.status
+            changed = snapshot is not old_snapshot and status != old_status
+            if changed:
+                logger.info(f"Status of machines is changed, site {site}")
+                try:
+                    machines = [machine for machine in await database.get_machines(bot.id)
+                                if machine.site == site and machine.seq_num in status]
+                except ConnectionError:
+                    machines = snapshot.machines
+                changed_machines = {machine.seq_num for machine in machines
+                                    if status.get(machine.seq_num) != old_status.get(machine.seq_num)}
+                users_id = list(await get_recipients(site, changed_machines))
+                message = text.render_status(snapshot, machines, site)
+                if users_id:
                     try:
-                        machines = await database.get_machines(bot.id)
-                    except ConnectionError:
-                        machines = await webparser.get_machines(session)
-                    users_id = set()
-                    for machine in machines:
-                        if status[machine.seq_num] != old_status[machine.seq_num]:
-                            users_id.update(await database.get_sub_users(machine.seq_num, machine.bot_id))
-                    users_id = list(users_id)
-                    await mailing(
-                        users_id=users_id,
-                        message=await text.get_status(),
-                        reply_markup=keyboard.menu_update
-                    )
-                    old_status = status
-            except ConnectionError:
-                pass
-            await asyncio.sleep(config.UPDATE_TIME)
+                        await outbox.enqueue(site, snapshot.version, message, users_id)
+                    except Exception as exc:
+                        if not isinstance(exc, ConnectionError):
+                            logger.exception(f"Outbox enqueue failed, site {site}")
+                        _run_in_background(mailing(
+                            users_id=users_id,
+                            message=message,
+                            reply_markup=keyboard.menu_update
+                        ))
+                old_snapshot = snapshot
+            delay = scheduler.on_success(changed)
+            logger.debug(f"Site {site} polling: {poller.stats()}, next poll in {delay:.1f} seconds")
+        except ConnectionError:
+            poll_errors.inc(site=site)
+            delay = scheduler.on_error()
+        except Exception:
+            logger.exception(f"Site {site} polling failed")
+            poll_errors.inc(site=site)
+            delay = scheduler.on_error()
+        poll_cycle_seconds.observe(time.perf_counter() - start, site=site)
 
 
+async def update_data() -> None:
+    await asyncio.gather(*(poll_site(site) for site in config.SITES))
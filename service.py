@@ -3,10 +3,15 @@ import os
 from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
 from cashews import Cache
 
+import config
+
 cache = Cache()
-cache.setup("mem://")
+cache.setup(config.CACHE_URL)
 bot = Bot(
     token=os.getenv("BOT_TOKEN"),
     default=DefaultBotProperties(
@@ -14,3 +19,38 @@ bot = Bot(
         link_preview_is_disabled=True
     )
 )
+_http_session: ClientSession | None = None
+
+
+def get_http_session() -> ClientSession:
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = ClientSession(
+            connector=TCPConnector(
+                limit_per_host=config.HTTP_LIMIT_PER_HOST,
+                ttl_dns_cache=config.HTTP_DNS_TTL,
+                keepalive_timeout=config.HTTP_KEEPALIVE_TIMEOUT
+            ),
+            timeout=ClientTimeout(
+                total=None,
+                connect=config.HTTP_CONNECT_TIMEOUT,
+                sock_read=config.HTTP_READ_TIMEOUT
+            )
+        )
+    return _http_session
+
+
+async def close_http_session() -> None:
+    global _http_session
+    if _http_session is not None:
+        await _http_session.close()
+    _http_session = None
+
+
+def create_fsm_storage() -> BaseStorage:
+    if config.FSM_STORAGE_URL.startswith("memory://"):
+        return MemoryStorage()
+    from aiogram.fsm.storage.redis import RedisStorage
+    return RedisStorage.from_url(config.FSM_STORAGE_URL,
+                                 state_ttl=config.FSM_STATE_TTL,
+                                 data_ttl=config.FSM_STATE_TTL)
@@ -0,0 +1,117 @@
+import asyncio
+import functools
+import json
+import logging
+import time
+import uuid
+from typing import Awaitable, Callable
+
+from cashews import Cache
+
+import config
+import webparser
+from webparser import Snapshot
+from service import cache, get_http_session
+
+logger = logging.getLogger(__name__)
+
+
+class StatusStore:
+    def __init__(self,
+                 fetch: Callable[[], Awaitable[Snapshot]],
+                 max_age: float,
+                 shared: Cache | None = None,
+                 key: str = "snapshot",
+                 shared_ttl: float = 0
+                 ) -> None:
+        self.fetch = fetch
+        self.max_age = max_age
+        self.shared = shared
+        self.key = key
+        self.shared_ttl = shared_ttl
+        self._checked = 0.0
+        self.snapshot: Snapshot | None = None
+        self._updated = 0.0
+        self._refresh: asyncio.Task | None = None
+        self._lock_value = uuid.uuid4().hex
+        self.refreshes = 0
+
+    @property
+    def age(self) -> float:
+        return time.time() - self._updated
+
+    async def publish(self, snapshot: Snapshot) -> None:
+        self.snapshot = snapshot
+        self._updated = time.time()
+        if self.shared is not None:
+            data = json.dumps([self._updated, snapshot.dump()], ensure_ascii=False, separators=(",", ":"))
+            await self.shared.set(self.key, data.encode(), expire=config.SHARED_SNAPSHOT_TTL)
+
+    async def _load_shared(self) -> bool:
+        if self.shared is None:
+            return False
+        self._checked = time.monotonic()
+        data = await self.shared.get(self.key)
+        if data is None:
+            return False
+        updated, snapshot = json.loads(data)
+        if updated <= self._updated:
+            return False
+        self.snapshot = Snapshot.load(snapshot)
+        self._updated = updated
+        return True
+
+    async def get(self) -> tuple[Snapshot, float]:
+        if self.snapshot is None or self.age > self.max_age or time.monotonic() - self._checked > self.shared_ttl:
+            await self._load_shared()
+        if self.snapshot is None:
+            await asyncio.shield(self._start_refresh())
+        elif self.age > self.max_age:
+            self._start_refresh()
+        return self.snapshot, self.age
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self._do_refresh())
+            self._refresh.add_done_callback(self._refresh_done)
+        return self._refresh
+
+    async def _do_refresh(self) -> None:
+        lock = f"{self.key}:lock"
+        locked = False
+        if self.shared is not None:
+            locked = await self.shared.set_lock(lock, self._lock_value, expire=config.SHARED_LOCK_TTL)
+            deadline = time.monotonic() + config.SHARED_LOCK_TTL
+            while not locked and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+                if await self._load_shared():
+                    logger.debug("Status store is refreshed by another worker")
+                    return
+        try:
+            self.refreshes += 1
+            await self.publish(await self.fetch())
+            logger.debug("Status store is refreshed")
+        finally:
+            if locked:
+                await self.shared.unlock(lock, self._lock_value)
+
+    @staticmethod
+    def _refresh_done(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Status store refresh failed: {task.exception()}")
+
+
+async def _fetch_snapshot(site: str) -> Snapshot:
+    return await webparser.get_snapshot(get_http_session(), site)
+
+
+stores = {
+    site: StatusStore(
+        fetch=functools.partial(_fetch_snapshot, site),
+        max_age=config.STATUS_TTL,
+        shared=cache if config.CACHE_SHARED else None,
+        key=f"snapshot:{site}",
+        shared_ttl=config.UPDATE_TIME_MIN
+    )
+    for site in config.SITES
+}
@@ -0,0 +1,57 @@
+import logging
+from array import array
+from bisect import bisect_left
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+_Key = tuple[int, str, int]
+
+
+class SubscriptionIndex:
+    def __init__(self) -> None:
+        self._users: dict[_Key, array] = {}
+        self.loaded = False
+
+    def load(self, subs: Iterable[tuple[int, int, int, str]]) -> None:
+        users: dict[_Key, list[int]] = {}
+        for user_id, seq_num, bot_id, site in subs:
+            users.setdefault((bot_id, site, seq_num), []).append(user_id)
+        self._users = {key: array("q", sorted(set(users_id))) for key, users_id in users.items()}
+        self.loaded = True
+        logger.info(f"Load subscription index: {len(self)} subscriptions")
+
+    def add(self, user_id: int, seq_num: int, bot_id: int, site: str) -> None:
+        users_id = self._users.setdefault((bot_id, site, seq_num), array("q"))
+        pos = bisect_left(users_id, user_id)
+        if pos == len(users_id) or users_id[pos] != user_id:
+            users_id.insert(pos, user_id)
+
+    def remove(self, user_id: int, seq_num: int, bot_id: int, site: str) -> None:
+        users_id = self._users.get((bot_id, site, seq_num))
+        if users_id is None:
+            return
+        pos = bisect_left(users_id, user_id)
+        if pos < len(users_id) and users_id[pos] == user_id:
+            del users_id[pos]
+        if not users_id:
+            del self._users[(bot_id, site, seq_num)]
+
+    def remove_user(self, user_id: int) -> None:
+        for bot_id, site, seq_num in list(self._users.keys()):
+            self.remove(user_id, seq_num, bot_id, site)
+
+    def get_sub_users(self, seq_num: int, bot_id: int, site: str) -> tuple[int]:
+        return tuple(self._users.get((bot_id, site, seq_num), ()))
+
+    def recipients(self, bot_id: int, site: str, seq_nums: Iterable[int]) -> set[int]:
+        users_id = set()
+        for seq_num in seq_nums:
+            users_id.update(self._users.get((bot_id, site, seq_num), ()))
+        return users_id
+
+    def __len__(self) -> int:
+        return sum(len(users_id) for users_id in self._users.values())
+
+
+index = SubscriptionIndex()
@@ -1,12 +1,14 @@
+import asyncio
+import json
 import logging
+from typing import Sequence
 
-from aiohttp import ClientSession
-
-import database
+from database import Machine
 import webparser
+import status_store
 from service import cache
-from service import bot
 import config
+from metrics import registry
 
 logger = logging.getLogger(__name__)
 
@@ -24,39 +26,128 @@ TRANSLATE = {
     }
 
 
-@cache(ttl=config.STATUS_TTL)
 async def get_status() -> dict[str: str]:
-    async with ClientSession() as session:
+    results = await asyncio.gather(*(store.get() for store in status_store.stores.values()),
+                                   return_exceptions=True)
+    reports = {lang: [] for lang in config.LANGUAGES}
+    available = False
+    for site, result in zip(status_store.stores.keys(), results):
+        if isinstance(result, ConnectionError):
+            for lang in reports:
+                reports[lang].append(unavailable[lang].format(site=site))
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        available = True
+        snapshot, age = result
+        report = await _render_shared(site, snapshot)
+        for lang in reports:
+            reports[lang].append(report[lang] if age <= config.STATUS_TTL
+                                 else report[lang] + stale[lang].format(age=int(age)))
+    if not available:
+        raise ConnectionError("All sites are unavailable")
+    return {lang: "\n".join(report) for lang, report in reports.items()}
+
+
+def _render_line(lang: str, machine_type: str, seq_num: int, status: str) -> str:
+    if lang != "ru":
         try:
-            machines = await database.get_machines(bot.id)
-        except ConnectionError:
-            machines = await webparser.get_machines(session)
-        status = await webparser.get_machines_status(session)
-        time = await webparser.get_time_last_update(session)
-    report = {
-        "ru": f"Состояние машин {time[0]} в {time[1]}:\n",
-        "en": f"Status of machines {time[0]} in {time[1]}:\n"
-    }
-    for lang in report.keys():
-        for machine in machines:
-            if lang != "ru":
-                try:
-                    trans_type = TRANSLATE[lang][machine.type]
-                except KeyError:
-                    trans_type = machine.type
-                    logger.warning(f"None translate tor type {trans_type}")
-                try:
-                    trans_status = TRANSLATE[lang][status[machine.seq_num]]
-                except KeyError:
-                    trans_status = status[machine.seq_num]
-                    logger.warning(f"None translate tor status {trans_status}")
-                report[lang] += (f"{'🟢' if status[machine.seq_num] == 'Свободно' else '🔴'}"
-                                 f" {trans_type} {machine.seq_num}"
-                                 f" - {trans_status}\n")
-            else:
-                report[lang] += (f"{'🟢' if status[machine.seq_num] == 'Свободно' else '🔴'}"
-                                 f" {machine.type} {machine.seq_num}"
-                                 f" - {status[machine.seq_num]}\n")
+            trans_type = TRANSLATE[lang][machine_type]
+        except KeyError:
+            trans_type = machine_type
+            logger.warning(f"None translate tor type {trans_type}")
+        try:
+            trans_status = TRANSLATE[lang][status]
+        except KeyError:
+            trans_status = status
+            logger.warning(f"None translate tor status {trans_status}")
+    else:
+        trans_type, trans_status = machine_type, status
+    return (f"{'🟢' if status == 'Свободно' else '🔴'}"
+            f" {trans_type} {seq_num}"
+            f" - {trans_status}\n")
+
+
+class StatusRenderer:
+    def __init__(self, title: str | None = None) -> None:
+        self.title = title
+        self._key = None
+        self._reports: dict[str: str] = {}
+        self._lines: dict[tuple[str, int]: tuple[tuple[str, str], str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def is_cached(self, snapshot: webparser.Snapshot) -> bool:
+        return self._key == snapshot.version
+
+    def adopt(self, snapshot: webparser.Snapshot, reports: dict[str: str]) -> None:
+        self._key = snapshot.version
+        self._reports = reports
+        self._lines = {}
+
+    def render(self, snapshot: webparser.Snapshot, machines: Sequence[Machine] | None = None) -> dict[str: str]:
+        if machines is None or machines is snapshot.machines:
+            machines = snapshot.machines
+            key = snapshot.version
+        else:
+            key = (snapshot.version, tuple((machine.seq_num, machine.type) for machine in machines))
+        if key == self._key:
+            self.hits += 1
+            return self._reports
+        self.misses += 1
+        status = snapshot.status
+        time = snapshot.time_last_update
+        reports = {
+            "ru": f"Состояние машин {time[0]} в {time[1]}:\n",
+            "en": f"Status of machines {time[0]} in {time[1]}:\n"
+        }
+        if self.title:
+            reports = {lang: f"🏠 {self.title}\n{header}" for lang, header in reports.items()}
+        lines = {}
+        for lang in reports.keys():
+            report = [reports[lang]]
+            for machine in machines:
+                machine_status = status.get(machine.seq_num)
+                if machine_status is None:
+                    continue
+                content = (machine.type, machine_status)
+                cached = self._lines.get((lang, machine.seq_num))
+                if cached is None or cached[0] != content:
+                    cached = (content, _render_line(lang, machine.type, machine.seq_num, content[1]))
+                lines[(lang, machine.seq_num)] = cached
+                report.append(cached[1])
+            reports[lang] = "".join(report)
+        self._key = key
+        self._reports = reports
+        self._lines = lines
+        return reports
+
+
+renderers = {site: StatusRenderer(title=site if len(config.SITES) > 1 else None) for site in config.SITES}
+for site, renderer in renderers.items():
+    registry.track_cache(f"status_report:{site}", renderer)
+
+
+def render_status(snapshot: webparser.Snapshot,
+                  machines: Sequence[Machine] | None = None,
+                  site: str = config.DEFAULT_SITE
+                  ) -> dict[str: str]:
+    return renderers[site].render(snapshot, machines)
+
+
+async def _render_shared(site: str, snapshot: webparser.Snapshot) -> dict[str: str]:
+    renderer = renderers[site]
+    if not config.CACHE_SHARED or renderer.is_cached(snapshot):
+        return renderer.render(snapshot)
+    key = f"report:{site}:{snapshot.version}"
+    data = await cache.get(key)
+    if data is not None:
+        report = json.loads(data)
+        renderer.adopt(snapshot, report)
+        return report
+    report = renderer.render(snapshot)
+    data = json.dumps(report, ensure_ascii=False, separators=(",", ":"))
+    await cache.set(key, data.encode(), expire=config.SHARED_SNAPSHOT_TTL)
     return report
 
 
@@ -102,6 +193,10 @@ sub = {
     "subscribe": {
         "ru": "Вы подписались на машинки",
         "en": "You have subscribed to machines"
+    },
+    "outdated": {
+        "ru": "Список машинок изменился, откройте /sub ещё раз",
+        "en": "The list of machines has changed, open /sub again"
     }
 }
 unsub = {
@@ -109,6 +204,16 @@ unsub = {
     "en": "You have unsubscribed from all notifications"
 }
 
+unavailable = {
+    "ru": "🏠 {site}: сайт недоступен\n",
+    "en": "🏠 {site}: the site is unavailable\n"
+}
+
+stale = {
+    "ru": "\n⏳ Данные получены {age} с назад",
+    "en": "\n⏳ Data received {age} s ago"
+}
+
 error = {
     "ru": "В данный момент сервис недоступен, мы уже работаем над проблемой",
     "en": "The service is currently unavailable, we are already working on the problem"
@@ -1,5 +1,4 @@
 import logging
-from typing import Sequence
 
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
@@ -7,12 +6,14 @@ from aiogram.filters import Command
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy.exc import IntegrityError
 
 import text
+import catalog
 import keyboard
 import database
 import script
-from database import User, Machine, Sub
+import subscriptions
 from config import DEFAULT_LANG
 from config import LANGUAGES
 from service import bot
@@ -83,50 +84,65 @@ async def callback_update(callback: CallbackQuery) -> None:
 async def command_sub(message: Message, state: FSMContext) -> None:
     try:
         await script.check_user(message)
-        machines = await database.get_machines(bot.id)
+        machines = await catalog.get_catalog(bot.id)
         lang = await database.get_user_lang(message.from_user.id)
-        subs = list(await database.get_user_subs(message.from_user.id))
-        kb = await keyboard.menu_sub(machines, subs)
+        mask = machines.to_mask(await database.get_user_subs(message.from_user.id))
+        kb = keyboard.sub_keyboard(machines).markup(mask)
         await message.answer(text=text.sub["start"][lang],
                              reply_markup=kb[lang]
                              )
-        await state.clear()
         await state.set_state(OrderSub.choosing_sub)
-        await state.update_data(machines=machines,
-                                lang=lang,
-                                subs=subs
-                                )
+        await state.set_data({"v": machines.version, "s": mask, "o": mask})
     except ConnectionError:
         await message.answer(text=text.error[DEFAULT_LANG],
                              reply_markup=keyboard.menu_delete[DEFAULT_LANG]
                              )
 
 
+async def _get_picker(callback: CallbackQuery, state: FSMContext) -> tuple[catalog.Catalog | None, int, str]:
+    data = await state.get_data()
+    try:
+        lang = await database.get_user_lang(callback.from_user.id)
+    except ConnectionError:
+        lang = DEFAULT_LANG
+    try:
+        machines = await catalog.get_catalog_version(bot.id, data.get("v"))
+    except ConnectionError:
+        machines = None
+    if machines is None:
+        await callback.answer(text.sub["outdated"][lang])
+        await callback.message.delete()
+        await state.clear()
+    return machines, data.get("s", 0), lang
+
+
 @router_private.callback_query(
     OrderSub.choosing_sub,
     F.data.startswith("m")
 )
 async def callback_set_subs(callback: CallbackQuery, state: FSMContext) -> None:
-    data = await state.get_data()
-    machines: Sequence[Machine] = data["machines"]
-    lang: str = data["lang"]
-    subs: list = data["subs"]
-    sub = int(callback.data[1:])
-    if sub in subs:
-        subs.remove(sub)
-    else:
-        subs.append(sub)
-    kb = await keyboard.menu_sub(machines, subs)
+    try:
+        site, seq_num = callback.data[1:].rsplit(":", 1)
+        seq_num = int(seq_num)
+    except ValueError:
+        logger.debug(f"Malformed callback data {callback.data}")
+        await callback.answer()
+        return
+    machines, mask, lang = await _get_picker(callback, state)
+    if machines is None:
+        return
+    try:
+        mask, kb = keyboard.sub_keyboard(machines).toggle(mask, site, seq_num)
+    except KeyError:
+        logger.debug(f"Machine {site}:{seq_num} is not in the catalog")
+        return
+    await state.update_data(s=mask)
     try:
         await callback.message.edit_text(text=text.sub["start"][lang],
                                          reply_markup=kb[lang]
                                          )
     except TelegramBadRequest:
         logger.debug("Sub has not changed")
-    await state.update_data(machines=machines,
-                            lang=lang,
-                            subs=subs
-                            )
 
 
 @router_private.callback_query(
@@ -134,25 +150,31 @@ async def callback_set_subs(callback: CallbackQuery, state: FSMContext) -> None:
     F.data.startswith("sub")
 )
 async def callback_subs(callback: CallbackQuery, state: FSMContext) -> None:
-    data = await state.get_data()
-    machines: Sequence[Machine] = data["machines"]
-    lang: str = data["lang"]
-    subs: list = data["subs"]
+    machines, mask, lang = await _get_picker(callback, state)
+    if machines is None:
+        return
+    original = (await state.get_data()).get("o", 0)
     await callback.answer(text.sub["subscribe"][lang])
     await callback.message.delete()
-    user_subs = await database.get_user_subs(callback.from_user.id)
-    for machine in machines:
-        if machine.seq_num in subs and machine.seq_num not in user_subs:
-            sub = Sub(
-                user_id=callback.from_user.id,
-                seq_num=machine.seq_num,
-                bot_id=machine.bot_id
-            )
-            await database.add_object(sub)
-        elif machine.seq_num not in subs and machine.seq_num in user_subs:
-            await database.remove_by_id(obj_type=Sub,
-                                        obj_id=(callback.from_user.id, machine.seq_num, machine.bot_id))
-    await state.clear()
+    added = machines.to_subs(mask & ~original)
+    removed = machines.to_subs(original & ~mask)
+    try:
+        user_subs = await database.apply_sub_diff(callback.from_user.id, bot.id, added, removed)
+        for site, seq_num in removed:
+            subscriptions.index.remove(callback.from_user.id, seq_num, bot.id, site)
+        for site, seq_num in user_subs:
+            subscriptions.index.add(callback.from_user.id, seq_num, bot.id, site)
+    except IntegrityError:
+        logger.warning(f"Subs of a user with id {callback.from_user.id} refer to removed machines")
+        await callback.message.answer(text=text.sub["outdated"][lang],
+                                      reply_markup=keyboard.menu_delete[lang]
+                                      )
+    except ConnectionError:
+        await callback.message.answer(text=text.error[DEFAULT_LANG],
+                                      reply_markup=keyboard.menu_delete[DEFAULT_LANG]
+                                      )
+    finally:
+        await state.clear()
 
 
 @router_private.callback_query(F.data.in_(LANGUAGES))
@@ -186,6 +208,7 @@ async def command_unsub(message: Message) -> None:
                              reply_markup=keyboard.menu_delete[lang]
                              )
         await database.remove_subs(message.from_user.id)
+        subscriptions.index.remove_user(message.from_user.id)
     except ConnectionError:
         await message.answer(text=text.error[DEFAULT_LANG],
                              reply_markup=keyboard.menu_delete[DEFAULT_LANG]
@@ -196,12 +219,15 @@ async def command_unsub(message: Message) -> None:
     OrderSub.choosing_sub,
     F.data == "unsub")
 async def command_unsub(callback: CallbackQuery, state: FSMContext) -> None:
-    data = await state.get_data()
-    lang: str = data["lang"]
+    try:
+        lang = await database.get_user_lang(callback.from_user.id)
+    except ConnectionError:
+        lang = DEFAULT_LANG
     await callback.answer(text=text.unsub[lang])
     await callback.message.delete()
     try:
         await database.remove_subs(callback.from_user.id)
+        subscriptions.index.remove_user(callback.from_user.id)
     except ConnectionError:
         await callback.message.answer(text=text.error[DEFAULT_LANG],
                                       reply_markup=keyboard.menu_delete[DEFAULT_LANG]
@@ -219,6 +245,7 @@ async def command_unsub(callback: CallbackQuery) -> None:
     await callback.answer(text=text.unsub[lang])
     try:
         await database.remove_subs(callback.from_user.id)
+        subscriptions.index.remove_user(callback.from_user.id)
     except ConnectionError:
         await callback.message.answer(text=text.error[DEFAULT_LANG],
                                       reply_markup=keyboard.menu_delete[DEFAULT_LANG]
@@ -0,0 +1,99 @@
+import asyncio
+import hmac
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+from pydantic import ValidationError
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookHandler:
+    def __init__(self,
+                 dp: Dispatcher,
+                 bot: Bot,
+                 secret_token: str,
+                 concurrency: int,
+                 queue_size: int
+                 ) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.secret_token = secret_token
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.queue_size = queue_size
+        self._tasks: set[asyncio.Task] = set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self.secret_token or not hmac.compare_digest(
+                request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), self.secret_token):
+            logger.warning("Webhook request with wrong secret token")
+            return web.Response(status=401)
+        if len(self._tasks) >= self.queue_size:
+            logger.warning(f"Webhook queue is full, {len(self._tasks)} updates are pending")
+            return web.Response(status=503)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except (ValueError, ValidationError):
+            logger.error("Webhook request with invalid update")
+            return web.Response(status=400)
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update) -> None:
+        async with self.semaphore:
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                logger.exception(f"Update {update.update_id} has not been processed")
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def check_config() -> None:
+    if config.WEBHOOK_URL and not config.WEBHOOK_SECRET:
+        raise ValueError("Webhook mode needs WEBHOOK_SECRET to verify that updates come from Telegram")
+
+
+def create_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    check_config()
+    handler = WebhookHandler(
+        dp=dp,
+        bot=bot,
+        secret_token=config.WEBHOOK_SECRET,
+        concurrency=config.WEBHOOK_CONCURRENCY,
+        queue_size=config.WEBHOOK_QUEUE_SIZE
+    )
+    app = web.Application()
+    app["webhook_handler"] = handler
+    app.router.add_post(config.WEBHOOK_PATH, handler.handle)
+    app.on_shutdown.append(lambda _: handler.close())
+    return app
+
+
+async def run(dp: Dispatcher, bot: Bot) -> None:
+    await bot.set_webhook(
+        url=f"{config.WEBHOOK_URL}{config.WEBHOOK_PATH}",
+        secret_token=config.WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=True
+    )
+    runner = web.AppRunner(create_app(dp, bot))
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.WEBHOOK_HOST, port=config.WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook server is started on {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}")
+    await dp.emit_startup(bot=bot)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await runner.cleanup()
@@ -1,63 +1,136 @@
 import re
+import time
+import asyncio
+import hashlib
 import logging
-from typing import Sequence
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from functools import cached_property
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Sequence
 
 from bs4 import BeautifulSoup
-from aiohttp import ClientSession
+from lxml import etree
+from aiohttp import ClientResponse, ClientSession
 from aiohttp.client_exceptions import ClientError, ClientConnectorError, ClientResponseError
 
 
 import config
 from database import Machine
+from metrics import registry
 
 
 _MachineStatus = dict[int: str]
 _TimeLastUpdate = tuple[str, ...]
 
 logger = logging.getLogger(__name__)
+fetch_seconds = registry.histogram("washbot_fetch_seconds", "Site request latency", ["site"])
+fetch_errors = registry.counter("washbot_fetch_errors_total", "Failed site requests", ["site", "reason"])
+parse_seconds = registry.histogram("washbot_parse_seconds", "Site page parse time in the worker", ["site"])
+parse_latency = registry.histogram("washbot_parse_latency_seconds", "Site page parse time including the queue", ["site"])
+poll_results = registry.counter("washbot_poll_results_total", "Site poll results", ["site", "result"])
 
 
-async def _get_site_soup(session: ClientSession) -> BeautifulSoup:
+class MachineInfo(NamedTuple):
+    seq_num: int
+    type: str
+    prise: int
+    site: str = config.DEFAULT_SITE
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    machines: tuple[MachineInfo, ...]
+    status: Mapping[int, str]
+    time_last_update: _TimeLastUpdate
+
+    @cached_property
+    def version(self) -> str:
+        content = repr((self.machines, sorted(self.status.items()), self.time_last_update))
+        return hashlib.blake2b(content.encode(), digest_size=8).hexdigest()
+
+    def dump(self) -> list:
+        return [
+            [list(machine) for machine in self.machines],
+            [[seq_num, status] for seq_num, status in self.status.items()],
+            list(self.time_last_update)
+        ]
+
+    @classmethod
+    def load(cls, data: list) -> "Snapshot":
+        machines, status, time_last_update = data
+        return cls(
+            machines=tuple(MachineInfo(*machine) for machine in machines),
+            status=MappingProxyType({seq_num: value for seq_num, value in status}),
+            time_last_update=tuple(time_last_update)
+        )
+
+
+async def _fetch(session: ClientSession,
+                 site: str,
+                 url: str,
+                 headers: dict[str: str] | None = None
+                 ) -> tuple[ClientResponse, bytes]:
+    start = time.perf_counter()
     try:
-        async with session.get(config.SITE_URL) as response:
+        async with session.get(url, headers=headers) as response:
             try:
                 response.raise_for_status()
-                soup = BeautifulSoup(await response.text(), "lxml")
-                logger.info(f"Request to site {config.SITE_URL}")
-                return soup
+                body = await response.read()
+                logger.info(f"Request to site {url}")
+                return response, body
             except ClientResponseError as exc:
                 msg = f"HTTP error, status code {response.status}"
                 logger.error(msg)
+                fetch_errors.inc(site=site, reason="http")
                 raise ConnectionError(msg) from exc
     except ClientConnectorError as exc:
         msg = "Connection error"
         logger.error(msg)
+        fetch_errors.inc(site=site, reason="connection")
+        raise ConnectionError(msg) from exc
+    except asyncio.TimeoutError as exc:
+        msg = f"Timeout error, site {url}"
+        logger.error(msg)
+        fetch_errors.inc(site=site, reason="timeout")
+        raise ConnectionError(msg) from exc
+    except ClientError as exc:
+        msg = "Other requests exceptions"
+        logger.error(msg, exc_info=True)
+        fetch_errors.inc(site=site, reason="other")
         raise ConnectionError(msg) from exc
-    except ClientError:
-        logger.error("Other requests exceptions", exc_info=True)
+    finally:
+        fetch_seconds.observe(time.perf_counter() - start, site=site)
 
 
-async def get_machines_status(session: ClientSession) -> _MachineStatus:
-    site_soup = await _get_site_soup(session)
+async def _get_site_html(session: ClientSession, site: str | None = None) -> str:
+    site = site or config.DEFAULT_SITE
+    response, body = await _fetch(session, site, config.SITES[site])
+    return body.decode(response.get_encoding())
+
+
+def _parse_machines(site_soup: BeautifulSoup) -> tuple[tuple[MachineInfo, ...], _MachineStatus]:
+    catalog = []
     machines_status = {}
     try:
         machines = site_soup.find_all("div", class_=re.compile(r"col mb-3 childItem child.*"))
         for machine in machines:
-            num = int(machine.find("div", class_="text-center").text)
-            status = re.search(
-                r"[^ ].*[^ ]",
-                machine.find_all("div", class_="text-center")[1].text.replace("\n", "")
-                ).group()
+            text_center = machine.find_all("div", class_="text-center")
+            num = int(text_center[0].text)
+            kind = machine.div["title"]
+            prise = machine.find("span", class_=re.compile(r"pl-1 pr-1 withTooltip.*")).text
+            prise = int(re.search(r"\d+", prise).group())
+            status = re.search(r"[^ ].*[^ ]", text_center[1].text.replace("\n", "")).group()
+            catalog.append(MachineInfo(seq_num=num, type=kind, prise=prise))
             machines_status.update({num: status})
-        return machines_status
-    except AttributeError:
-        logger.error("Search machine status: some information has not been found, "
+        return tuple(catalog), machines_status
+    except (AttributeError, IndexError, KeyError):
+        logger.error("Search machines: some information has not been found, "
                      "a change in the search algorithm is required")
-        return ()
+        return (), {}
 
 
-async def get_time_last_update(session: ClientSession) -> _TimeLastUpdate:
-    site_soup = await _get_site_soup(session)
+def _parse_time_last_update(site_soup: BeautifulSoup) -> _TimeLastUpdate:
     try:
         time_last_update = site_soup.find("div", attrs={"data-toggle": "tooltip"}).text
         date = re.search(r"\d\d\.\d\d\.\d{4}", time_last_update).group()
@@ -69,23 +142,210 @@ async def get_time_last_update(session: ClientSession) -> _TimeLastUpdate:
         return tuple()
 
 
-async def get_machines(session: ClientSession) -> Sequence[Machine]:
-    site_soup = await _get_site_soup(session)
-    result = []
+def _parse_snapshot_bs4(html: str) -> Snapshot:
+    site_soup = BeautifulSoup(html, "lxml")
+    machines, status = _parse_machines(site_soup)
+    return Snapshot(
+        machines=machines,
+        status=MappingProxyType(status),
+        time_last_update=_parse_time_last_update(site_soup)
+    )
+
+
+_XPATH_MACHINES = etree.XPath("//div[contains(normalize-space(@class), 'col mb-3 childItem child')]")
+_XPATH_TEXT_CENTER = etree.XPath(".//div[contains(concat(' ', normalize-space(@class), ' '), ' text-center ')]")
+_XPATH_KIND = etree.XPath("(.//div)[1]/@title")
+_XPATH_PRISE = etree.XPath("(.//span[contains(normalize-space(@class), 'pl-1 pr-1 withTooltip')])[1]")
+_XPATH_TIME_LAST_UPDATE = etree.XPath("(//div[@data-toggle='tooltip'])[1]")
+_XPATH_STRING = etree.XPath("string()")
+_HTML_PARSER = etree.HTMLParser()
+
+
+def _parse_snapshot_lxml(html: str) -> Snapshot:
+    root = etree.fromstring(html, _HTML_PARSER)
+    catalog = []
+    machines_status = {}
+    time_last_update = tuple()
+    if root is None:
+        return Snapshot(machines=(), status=MappingProxyType({}), time_last_update=())
     try:
-        machines = site_soup.find_all("div", class_=re.compile(r"col mb-3 childItem child.*"))
-        for machine in machines:
-            num = int(machine.find("div", class_="text-center").text)
-            kind = machine.div["title"]
-            prise = machine.find("span", class_=re.compile(r"pl-1 pr-1 withTooltip.*")).text
+        for machine in _XPATH_MACHINES(root):
+            text_center = _XPATH_TEXT_CENTER(machine)
+            num = int(_XPATH_STRING(text_center[0]))
+            kind = _XPATH_KIND(machine)[0]
+            prise = _XPATH_STRING(_XPATH_PRISE(machine)[0])
             prise = int(re.search(r"\d+", prise).group())
-            result.append(Machine(
-                seq_num=num,
-                type=kind,
-                prise=prise
-            ))
-        return tuple(result)
-    except AttributeError:
+            status = re.search(r"[^ ].*[^ ]", _XPATH_STRING(text_center[1]).replace("\n", "")).group()
+            catalog.append(MachineInfo(seq_num=num, type=kind, prise=prise))
+            machines_status.update({num: status})
+    except (AttributeError, IndexError):
         logger.error("Search machines: some information has not been found, "
                      "a change in the search algorithm is required")
-        return ()
+        catalog, machines_status = [], {}
+    try:
+        text = _XPATH_STRING(_XPATH_TIME_LAST_UPDATE(root)[0])
+        date = re.search(r"\d\d\.\d\d\.\d{4}", text).group()
+        time = re.search(r"\d\d:\d\d", text).group()
+        time_last_update = tuple([date, time])
+    except (AttributeError, IndexError):
+        logger.error("Search time last update: some information has not been found, "
+                     "a change in the search algorithm is required")
+    return Snapshot(
+        machines=tuple(catalog),
+        status=MappingProxyType(machines_status),
+        time_last_update=time_last_update
+    )
+
+
+_PARSER_BACKENDS = {
+    "bs4": _parse_snapshot_bs4,
+    "lxml": _parse_snapshot_lxml
+}
+
+
+def parse_snapshot(html: str, backend: str | None = None, site: str | None = None) -> Snapshot:
+    snapshot = _PARSER_BACKENDS[backend or config.PARSER_BACKEND](html)
+    if site is None or site == config.DEFAULT_SITE:
+        return snapshot
+    return replace(snapshot, machines=tuple(machine._replace(site=site) for machine in snapshot.machines))
+
+
+def _parse_dump(html: str, backend: str, site: str | None) -> tuple[float, list]:
+    start = time.perf_counter()
+    data = parse_snapshot(html, backend=backend, site=site).dump()
+    return time.perf_counter() - start, data
+
+
+class ParserExecutor:
+    def __init__(self, kind: str, workers: int) -> None:
+        self.kind = kind
+        self.workers = workers
+        self._executor: Executor | None = None
+        self.pending = 0
+        self.max_pending = 0
+        self.parses = 0
+        self.parse_time = 0.0
+        self.max_parse_time = 0.0
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    def _get_executor(self) -> Executor | None:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            elif self.kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="parser")
+        return self._executor
+
+    async def parse(self, html: str, site: str | None = None) -> Snapshot:
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        start = time.perf_counter()
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                parse_time, data = _parse_dump(html, config.PARSER_BACKEND, site)
+            else:
+                parse_time, data = await asyncio.get_running_loop().run_in_executor(
+                    executor, _parse_dump, html, config.PARSER_BACKEND, site
+                )
+        finally:
+            self.pending -= 1
+        latency = time.perf_counter() - start
+        parse_seconds.observe(parse_time, site=site or config.DEFAULT_SITE)
+        parse_latency.observe(latency, site=site or config.DEFAULT_SITE)
+        self.parses += 1
+        self.parse_time += parse_time
+        self.max_parse_time = max(self.max_parse_time, parse_time)
+        self.latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        logger.debug(f"Parse site {site or config.DEFAULT_SITE}: {parse_time * 1000:.1f} ms, "
+                     f"{latency * 1000:.1f} ms with queue, {self.pending} pending")
+        return Snapshot.load(data)
+
+    def stats(self) -> dict[str: float]:
+        return {
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "parses": self.parses,
+            "avg_parse_time": self.parse_time / self.parses if self.parses else 0.0,
+            "max_parse_time": self.max_parse_time,
+            "avg_latency": self.latency / self.parses if self.parses else 0.0,
+            "max_latency": self.max_latency
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+parser = ParserExecutor(kind=config.PARSER_EXECUTOR, workers=config.PARSER_WORKERS)
+registry.gauge("washbot_parse_pending", "Site pages waiting for or being parsed", func=lambda: parser.pending)
+
+
+async def get_snapshot(session: ClientSession, site: str | None = None) -> Snapshot:
+    return await parser.parse(await _get_site_html(session, site), site=site)
+
+
+class SitePoller:
+    def __init__(self, url: str | None = None, site: str | None = None) -> None:
+        self.site = site or config.DEFAULT_SITE
+        self.url = url or config.SITES[self.site]
+        self.snapshot: Snapshot | None = None
+        self._etag: str | None = None
+        self._last_modified: str | None = None
+        self._body_hash: bytes | None = None
+        self.not_modified = 0
+        self.hash_hits = 0
+        self.full_parses = 0
+
+    async def poll(self, session: ClientSession) -> Snapshot:
+        headers = {}
+        if self.snapshot is not None:
+            if self._etag:
+                headers["If-None-Match"] = self._etag
+            if self._last_modified:
+                headers["If-Modified-Since"] = self._last_modified
+        response, body = await _fetch(session, self.site, self.url, headers)
+        if response.status == 304 and self.snapshot is not None:
+            self.not_modified += 1
+            poll_results.inc(site=self.site, result="not_modified")
+            logger.debug(f"Site {self.url} is not modified")
+            return self.snapshot
+        self._etag = response.headers.get("ETag")
+        self._last_modified = response.headers.get("Last-Modified")
+        body_hash = hashlib.blake2b(body, digest_size=16).digest()
+        if body_hash == self._body_hash and self.snapshot is not None:
+            self.hash_hits += 1
+            poll_results.inc(site=self.site, result="hash_hit")
+            logger.debug(f"Site {self.url} body has not changed")
+            return self.snapshot
+        self.snapshot = await parser.parse(body.decode(response.get_encoding()), site=self.site)
+        self._body_hash = body_hash
+        self.full_parses += 1
+        poll_results.inc(site=self.site, result="parsed")
+        return self.snapshot
+
+    def stats(self) -> dict[str: int]:
+        return {
+            "not_modified": self.not_modified,
+            "hash_hits": self.hash_hits,
+            "full_parses": self.full_parses
+        }
+
+
+async def get_machines_status(session: ClientSession) -> _MachineStatus:
+    snapshot = await get_snapshot(session)
+    return dict(snapshot.status)
+
+
+async def get_time_last_update(session: ClientSession) -> _TimeLastUpdate:
+    snapshot = await get_snapshot(session)
+    return snapshot.time_last_update
+
+
+async def get_machines(session: ClientSession) -> Sequence[Machine]:
+    snapshot = await get_snapshot(session)
+    return tuple(Machine(seq_num=machine.seq_num, site=machine.site, type=machine.type, prise=machine.prise)
+                 for machine in snapshot.machines)